@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""Headless benchmark of the CiefpTvProgram EPG pipeline.
+
+Stubs the Enigma2 modules the plugin imports, generates synthetic weekly XMLTV feeds and measures ingest
+(parseFeed), render (prepareEPGContent) and "now" lookups, plus the wall time of a whole refresh (ingestFeed)
+in the parse pool against one thread. Compare against a saved baseline to catch regressions:
+
+    python3 tools/epg_benchmark.py --channels 56 --save-baseline bench_baseline.json
+    python3 tools/epg_benchmark.py --channels 56 --baseline bench_baseline.json --threshold 0.25
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import types
+import random
+import shutil
+import argparse
+import datetime
+import resource
+import tempfile
+from xml.sax.saxutils import escape
+
+PLUGINS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                           "usr", "lib", "enigma2", "python", "Plugins", "Extensions")
+
+CYRILLIC_WORDS = ["Вести", "дневник", "серија", "филм", "утакмица", "репортажа", "прилог", "Београд", "живот",
+                  "хроника", "фудбал", "документарни", "програм", "емисија", "гост", "музика", "ђак", "џез"]
+LATIN_WORDS = ["Dnevnik", "čokolada", "ćevapi", "šampionat", "žurnal", "đak", "Zagreb", "Sarajevo", "utakmica",
+               "serija", "dokumentarac", "vijesti", "Ljubljana", "košarka", "večernji", "žena", "šahovski"]
+
+
+def installStubs():
+    """Register minimal stand-ins for the Enigma2 modules imported by plugin.py."""
+
+    def module(name, **attrs):
+        mod = types.ModuleType(name)
+        mod.__dict__.update(attrs)
+        sys.modules[name] = mod
+        return mod
+
+    class Instance:
+        def setSelectionEnable(self, enabled):
+            pass
+
+        def setPixmap(self, pixmap):
+            pass
+
+    class Screen:
+        def __init__(self, session):
+            self.session = session
+            self.onClose = []
+            self.onLayoutFinish = []
+            self.widgets = {}
+
+        def __setitem__(self, key, value):
+            self.widgets[key] = value
+
+        def __getitem__(self, key):
+            return self.widgets[key]
+
+        def close(self, *args):
+            for callback in self.onClose:
+                callback()
+
+    class MenuList:
+        def __init__(self, items, enableWrapAround=False, content=None):
+            self.list = list(items)
+            self.index = 0
+            self.instance = Instance()
+
+        def setList(self, items):
+            self.list = items
+
+        def getCurrent(self):
+            return self.list[self.index] if self.list else None
+
+        def getSelectedIndex(self):
+            return self.index
+
+        def moveToIndex(self, index):
+            self.index = index
+
+    class Widget:
+        def __init__(self, *args, **kwargs):
+            self.instance = Instance()
+
+    class ETimer:
+        def __init__(self):
+            self.callback = []
+
+        def start(self, msec, single_shot=False):
+            pass
+
+        def stop(self):
+            pass
+
+    class ConfigElement:
+        def __init__(self, default=None, *args, **kwargs):
+            self.value = default
+
+        def addNotifier(self, notifier, initial_call=True):
+            if initial_call:
+                notifier(self)
+
+    class Namespace:
+        pass
+
+    config = Namespace()
+    config.plugins = Namespace()
+    module("enigma", eTimer=ETimer)
+    module("Screens")
+    module("Screens.Screen", Screen=Screen)
+    module("Screens.VirtualKeyBoard", VirtualKeyBoard=Widget)
+    module("Components")
+    module("Components.ActionMap", ActionMap=Widget)
+    module("Components.Label", Label=Widget)
+    module("Components.Pixmap", Pixmap=Widget)
+    module("Components.MenuList", MenuList=MenuList)
+    module("Components.ScrollLabel", ScrollLabel=Widget)
+    module("Components.ConfigList", ConfigListScreen=Widget)
+    module("Components.config", config=config, ConfigSubsection=Namespace, ConfigSelection=ConfigElement,
+           ConfigYesNo=ConfigElement, ConfigInteger=ConfigElement, ConfigText=ConfigElement,
+           ConfigDirectory=ConfigElement, ConfigClock=ConfigElement, getConfigListEntry=lambda *args: args)
+    module("Tools")
+    module("Tools.LoadPixmap", LoadPixmap=lambda path, *args, **kwargs: path)
+    module("Plugins")
+    module("Plugins.Plugin", PluginDescriptor=Widget)
+
+
+def description(rng, words):
+    return " ".join(rng.choice(words) for _ in range(rng.randint(30, 90))) + "."
+
+
+def generateFeed(path, channel_ids, days, per_day, rng):
+    """Write a gzip XMLTV feed with days of programmes for each channel, starting at local midnight today."""
+    midnight = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    slot = datetime.timedelta(minutes=24 * 60 // per_day)
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<tv generator-info-name="epg_benchmark">\n')
+        for chan_id in channel_ids:
+            f.write(f'<channel id="{chan_id}"><display-name>{chan_id}</display-name></channel>\n')
+        for chan_id in channel_ids:
+            offset = rng.choice(("+0100", "+0200"))
+            words = CYRILLIC_WORDS if rng.random() < 0.5 else LATIN_WORDS
+            for number in range(days * per_day):
+                start = midnight + number * slot
+                stop = start + slot
+                title = escape(" ".join(rng.choice(words) for _ in range(rng.randint(1, 5))))
+                f.write(f'<programme start="{start:%Y%m%d%H%M%S} {offset}" stop="{stop:%Y%m%d%H%M%S} {offset}" '
+                        f'channel="{chan_id}"><title lang="sr">{title}</title>'
+                        f'<desc lang="sr">{escape(description(rng, words))}</desc></programme>\n')
+        f.write('</tv>\n')
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+
+    def pick(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": ordered[-1]}
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def bestOf(repeat, function, *args):
+    """Fastest of repeat runs, which filters out scheduler noise."""
+    runs = [timed(function, *args) for _ in range(max(1, repeat))]
+    return min(runs, key=lambda run: run[0])
+
+
+def run(args):
+    installStubs()
+    sys.path.insert(0, os.path.abspath(PLUGINS_DIR))
+    from CiefpTvProgram import plugin
+    from CiefpTvProgram.ingest import ParsePool, parseFeed
+    from CiefpTvProgram.channels import ChannelRegistry
+
+    # Never touch the network or start the worker thread
+    plugin.EPGService.start = lambda self, *args, **kwargs: False
+
+    rng = random.Random(args.seed)
+    channels = [(channel.id, channel.name, channel.url) for channel in plugin.CHANNELS]
+    for number in range(len(channels), args.channels):
+        channels.append((f"synthetic-{number}.bench", f"Synthetic {number}", None))
+    plugin.CHANNELS = ChannelRegistry(channels[:args.channels])
+    channel_ids = [channel.id for channel in plugin.CHANNELS]
+
+    workdir = tempfile.mkdtemp(prefix="ciefp_bench_")
+    try:
+        feeds = []
+        for chan_id in channel_ids:
+            path = os.path.join(workdir, f"{chan_id}.xml.gz")
+            generateFeed(path, [chan_id], args.days, args.per_day, rng)
+            feeds.append(path)
+        feed_bytes = sum(os.path.getsize(path) for path in feeds)
+
+        screen = plugin.CiefpTvProgram(None)
+        service = screen.service
+
+        # Ingest
+        ingest_times = []
+        programmes = 0
+        since = service.getCacheSince()
+        for path in feeds:
+            elapsed, (epg, unmatched) = bestOf(args.repeat, parseFeed, path, channel_ids, since)
+            ingest_times.append(elapsed)
+            for chan_id, schedule in epg.items():
+                service.epgData[plugin.CHANNELS.get(chan_id).name] = schedule
+                programmes += len(schedule)
+        ingest_total = sum(ingest_times)
+
+        # Whole refresh (parse, cache merge, postings) of every feed, in one thread and in the parse pool
+        pipeline = {}
+        window = service.getRetentionWindow()
+        for label, workers in (("serial", 0), ("parallel", args.workers)):
+            cache_dir = os.path.join(workdir, f"cache_{label}")
+            start = time.perf_counter()
+            pool = ParsePool(workers)
+            for chan_id, path in zip(channel_ids, feeds):
+                pool.submit(chan_id, path, [chan_id], cache_dir, since, window)
+            failed = [key for key, result in pool.completed(block=True) if isinstance(result, Exception)]
+            pool.shutdown()
+            pipeline[label] = time.perf_counter() - start
+            if failed:
+                raise RuntimeError(f"Ingest failed for {failed}")
+        pipeline["processes"] = pool.processes
+
+        # Render, cold (every channel rendered from scratch) and warm (served from the render cache)
+        names = list(plugin.CHANNELS.names)
+        menu = screen["channelList"]
+        menu.setList(names)
+        render_times = []
+        warm_times = []
+        for index in range(len(names)):
+            menu.moveToIndex(index)
+            cold = []
+            for _ in range(max(1, args.repeat)):
+                screen.renderCache.clear()
+                cold.append(timed(screen.prepareEPGContent)[0])
+            render_times.append(min(cold))
+            warm_times.append(bestOf(args.repeat, screen.prepareEPGContent)[0])
+
+        # "Now" lookups at random times within the loaded week
+        schedules = list(service.epgData.values())
+        first = min(schedule.starts[0] for schedule in schedules if len(schedule))
+        last = max(schedule.starts[-1] for schedule in schedules if len(schedule))
+        lookup_times = []
+        for _ in range(args.lookups):
+            schedule = rng.choice(schedules)
+            moment = rng.randint(first, last)
+            lookup_times.append(timed(schedule.currentIndex, moment)[0])
+
+        # Search index, built per channel, then prefix queries of indexed words
+        index_times = []
+        for channel_name, schedule in service.epgData.items():
+            elapsed, postings = timed(plugin.buildPostings, schedule)
+            index_times.append(elapsed)
+            service.searchIndex.update(channel_name, schedule, postings)
+        vocabulary = sorted(service.searchIndex.postings)
+        search_times = []
+        for _ in range(args.searches):
+            word = rng.choice(vocabulary)[:4]
+            search_times.append(bestOf(args.repeat, service.searchIndex.search, word)[0])
+
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KB on Linux
+        return {
+            "channels": len(channel_ids),
+            "programmes": programmes,
+            "feed_bytes": feed_bytes,
+            "ingest": dict(percentiles(ingest_times), total=ingest_total,
+                           throughput=programmes / ingest_total if ingest_total else 0.0),
+            "render": dict(percentiles(render_times), total=sum(render_times),
+                           throughput=len(render_times) / sum(render_times)),
+            "render_warm": dict(percentiles(warm_times), total=sum(warm_times)),
+            "now_lookup": dict(percentiles(lookup_times), total=sum(lookup_times),
+                               throughput=len(lookup_times) / sum(lookup_times)),
+            "index": dict(percentiles(index_times), total=sum(index_times),
+                          throughput=len(index_times) / sum(index_times)),
+            "search": dict(percentiles(search_times), total=sum(search_times),
+                           throughput=len(search_times) / sum(search_times)),
+            "pipeline": pipeline,
+            "peak_rss_kb": peak_rss,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def printReport(report):
+    print(f"channels: {report['channels']}, programmes: {report['programmes']}, "
+          f"feeds: {report['feed_bytes'] / 1024:.0f} KB gzip, peak RSS: {report['peak_rss_kb'] / 1024:.1f} MB")
+    print(f"{'stage':<12} {'p50':>10} {'p95':>10} {'p99':>10} {'max':>10} {'throughput':>16}")
+    for stage, unit in (("ingest", "prog/s"), ("render", "chan/s"), ("render_warm", ""), ("now_lookup", "ops/s"),
+                         ("index", "chan/s"), ("search", "ops/s")):
+        entry = report[stage]
+        throughput = f"{entry['throughput']:.0f} {unit}" if "throughput" in entry else ""
+        print(f"{stage:<12} " + " ".join(f"{entry[key] * 1000:>8.3f}ms" for key in ("p50", "p95", "p99", "max"))
+              + f" {throughput:>16}")
+    if "pipeline" in report:
+        pipeline = report["pipeline"]
+        print(f"refresh: {pipeline['serial']:.2f}s in one thread, {pipeline['parallel']:.2f}s with "
+              f"{pipeline['processes']} parser processes ({pipeline['serial'] / pipeline['parallel']:.1f}x)")
+
+
+def compare(report, baseline, threshold):
+    """Return a list of regressions larger than threshold (fraction) against baseline."""
+    regressions = []
+    for stage in ("ingest", "render", "render_warm", "now_lookup", "index", "search"):
+        if stage not in baseline:
+            continue  # Baseline from an older version of this tool
+        for key in ("p50", "p95"):
+            old, new = baseline[stage][key], report[stage][key]
+            if old and new > old * (1 + threshold):
+                regressions.append(f"{stage} {key}: {old * 1000:.3f}ms -> {new * 1000:.3f}ms")
+        if "throughput" in report[stage]:
+            old, new = baseline[stage]["throughput"], report[stage]["throughput"]
+            if old and new < old * (1 - threshold):
+                regressions.append(f"{stage} throughput: {old:.0f} -> {new:.0f}")
+    old, new = baseline["peak_rss_kb"], report["peak_rss_kb"]
+    if old and new > old * (1 + threshold):
+        regressions.append(f"peak RSS: {old} KB -> {new} KB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--channels", type=int, default=56, help="channels to generate (default: 56)")
+    parser.add_argument("--days", type=int, default=7, help="days of programmes per channel (default: 7)")
+    parser.add_argument("--per-day", type=int, default=48, help="programmes per channel and day (default: 48)")
+    parser.add_argument("--lookups", type=int, default=100000, help="now lookups to time (default: 100000)")
+    parser.add_argument("--searches", type=int, default=200, help="search queries (default: 200)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="parser processes for the refresh stage (default: cores - 1, at most 3)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per sample, the fastest counts (default: 3)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed of the generated feeds")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="fail if the report regresses against this report")
+    parser.add_argument("--save-baseline", help="write the report as a new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed regression fraction (default: 0.25)")
+    args = parser.parse_args()
+
+    report = run(args)
+    printReport(report)
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=1, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print("Regressions over %d%%:" % (args.threshold * 100))
+            for regression in regressions:
+                print("  " + regression)
+            return 1
+        print("No regressions over %d%%" % (args.threshold * 100))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
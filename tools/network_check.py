@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""Checks of the CiefpTvProgram downloader against a local server that misbehaves.
+
+Starts an HTTP server on 127.0.0.1 whose paths stall, trickle, drop the connection, cut the body short or
+fail with 500, and verifies that every download stays within its deadlines, is retried where it should be,
+keeps the previous feed on failure and that the circuit breaker opens, recovers and survives cancelled
+trials. Exits with 1 if any check fails:
+
+    python3 tools/network_check.py
+"""
+import os
+import sys
+import time
+import socket
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+import http.server
+import socketserver
+
+PLUGINS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                           "usr", "lib", "enigma2", "python", "Plugins", "Extensions")
+
+BODY = b"<tv></tv>" * 100
+STALL_SECONDS = 30  # Longer than any check waits
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    hits = {}
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        Handler.hits[self.path] = Handler.hits.get(self.path, 0) + 1
+        if self.path == "/stall":
+            time.sleep(STALL_SECONDS)
+        elif self.path == "/drop":
+            self.connection.shutdown(socket.SHUT_RDWR)
+        elif self.path == "/500":
+            self.send_response(500)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif self.path in ("/trickle", "/truncated", "/slowbody"):
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(BODY)))
+            self.end_headers()
+            if self.path == "/truncated":
+                self.wfile.write(BODY[:10])
+                self.wfile.flush()
+                self.connection.shutdown(socket.SHUT_RDWR)
+                return
+            for start in range(0, len(BODY), 10):
+                try:
+                    self.wfile.write(BODY[start:start + 10])
+                    self.wfile.flush()
+                except OSError:
+                    return
+                time.sleep(0.05 if self.path == "/trickle" else STALL_SECONDS)
+        else:
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(BODY)))
+            self.end_headers()
+            self.wfile.write(BODY)
+
+
+class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class Clock:
+    """Manual clock for the circuit breaker."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def checks(downloader, base, workdir):
+    """Yield (name, passed, detail) of every check."""
+    dest = os.path.join(workdir, "feed.xml.gz")
+
+    def fetch(path, **kwargs):
+        kwargs.setdefault("breaker", downloader.CircuitBreaker())
+        client = downloader.EPGDownloader(**kwargs)
+        Handler.hits.pop(path, None)
+        start = time.monotonic()
+        try:
+            return client.fetch("check", base + path, dest), time.monotonic() - start, Handler.hits.get(path, 0)
+        finally:
+            client.pool.closeAll()
+
+    result, elapsed, hits = fetch("/ok")
+    yield "download", result.ok and open(dest, "rb").read() == BODY, f"status {result.status}"
+
+    result, elapsed, hits = fetch("/stall", timeout=0.5, retries=1)
+    yield "stalled server times out", not result.ok and elapsed < 3, f"{elapsed:.2f}s, {hits} attempts, {result.error}"
+
+    result, elapsed, hits = fetch("/trickle", timeout=1, request_deadline=1, retries=0)
+    yield "trickle stops at the request deadline", not result.ok and elapsed < 2, f"{elapsed:.2f}s, {result.error}"
+
+    result, elapsed, hits = fetch("/drop", retries=2)
+    yield "dropped connection is retried", not result.ok and hits == 3, f"{hits} attempts, {result.error}"
+
+    result, elapsed, hits = fetch("/500", retries=1)
+    yield "server error is retried", not result.ok and hits == 2, f"{hits} attempts, {result.error}"
+
+    result, elapsed, hits = fetch("/truncated", retries=0)
+    yield "truncated body keeps the old feed", not result.ok and open(dest, "rb").read() == BODY, f"{result.error}"
+
+    clock = Clock()
+    breaker = downloader.CircuitBreaker(threshold=2, cooldown=10, clock=clock)
+    fetch("/500", retries=1, breaker=breaker)
+    result, elapsed, hits = fetch("/ok", breaker=breaker)
+    yield "open circuit fails fast", not result.ok and hits == 0, f"{result.error}"
+    clock.now = 11
+    result, elapsed, hits = fetch("/ok", breaker=breaker)
+    yield "trial after the cooldown closes the circuit", result.ok and not breaker.openHosts(), f"hits {hits}"
+
+    # A trial request cut off by the refresh deadline must not keep the host blocked
+    breaker = downloader.CircuitBreaker(threshold=1, cooldown=10, clock=clock)
+    clock.now = 0
+    fetch("/500", retries=0, breaker=breaker)
+    clock.now = 11
+    client = downloader.EPGDownloader(breaker=breaker, timeout=STALL_SECONDS)
+    start = time.monotonic()
+    results, wall_time = client.downloadAll([("check", base + "/slowbody", dest, {})], None, 0.5)
+    elapsed = time.monotonic() - start
+    yield "refresh deadline cancels downloads", results["check"].error == "cancelled" and elapsed < 2, \
+        f"{elapsed:.2f}s"
+    trial_running = breaker.hosts["127.0.0.1"][2]
+    yield "cancelled trial releases the circuit", not trial_running and breaker.allow("127.0.0.1"), \
+        f"trial still marked running: {trial_running}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--verbose", action="store_true", help="show the downloader log")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.CRITICAL)
+    sys.path.insert(0, os.path.abspath(PLUGINS_DIR))
+    from CiefpTvProgram import downloader
+
+    downloader.BACKOFF_BASE = 0.05  # Retries in milliseconds instead of seconds
+    server = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    workdir = tempfile.mkdtemp(prefix="ciefp_network_")
+    failed = 0
+    try:
+        for name, passed, detail in checks(downloader, f"http://127.0.0.1:{server.server_address[1]}", workdir):
+            failed += not passed
+            print(f"{'ok' if passed else 'FAIL':<5} {name:<45} {detail}")
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+import json
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_VERSION = 1
+
+# One channel of the registry, position is its index in the channel list
+Channel = namedtuple("Channel", ["id", "name", "url", "position"])
+
+
+class ChannelRegistry:
+    """The channel set with O(1) lookups by ID, display name and list position.
+
+    Loaded once from a JSON file:
+        {"version": 1, "url_template": "https://.../{id}/...", "channels": [{"id": ..., "name": ..., "url": ...}]}
+    url is optional per channel and defaults to url_template filled with the channel ID.
+    """
+
+    def __init__(self, channels=()):
+        self.channels = []
+        self.byId = {}
+        self.byName = {}
+        for chan_id, name, url in channels:
+            chan_id = chan_id.lower()
+            if chan_id in self.byId or name in self.byName:
+                logger.warning("Duplicate channel %s (%s) ignored", chan_id, name)
+                continue
+            channel = Channel(chan_id, name, url, len(self.channels))
+            self.channels.append(channel)
+            self.byId[chan_id] = channel
+            self.byName[name] = channel
+        self.names = [channel.name for channel in self.channels]
+        self.ids = frozenset(self.byId)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("version") != REGISTRY_VERSION:
+            raise ValueError(f"Unsupported channel registry version {data.get('version')} in {path}")
+        template = data.get("url_template")
+        channels = []
+        for entry in data["channels"]:
+            url = entry.get("url") or (template.replace("{id}", entry["id"]) if template else None)
+            channels.append((entry["id"], entry["name"], url))
+        registry = cls(channels)
+        logger.debug("Loaded %s channels from %s", len(registry), path)
+        return registry
+
+    def __len__(self):
+        return len(self.channels)
+
+    def __iter__(self):
+        return iter(self.channels)
+
+    def get(self, chan_id):
+        return self.byId.get(chan_id)
+
+    def getByName(self, name):
+        return self.byName.get(name)
+
+    def at(self, position):
+        return self.channels[position % len(self.channels)]
@@ -0,0 +1,384 @@
+import os
+import time
+import random
+import socket
+import hashlib
+import threading
+import logging
+import http.client
+import urllib.parse
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4  # Concurrent downloads, bounded so the receiver stays responsive
+DEFAULT_TIMEOUT = 15  # Seconds a connect or a single read may stall
+REQUEST_DEADLINE = 60  # Seconds a whole request may take, however slowly data keeps trickling in
+RETRIES = 2  # Extra attempts after a transient failure (connection error, timeout, 5xx)
+BACKOFF_BASE = 1.0  # Seconds before the first retry, doubled for each further one and jittered
+BREAKER_THRESHOLD = 3  # Consecutive transient failures that open the circuit of a host
+BREAKER_COOLDOWN = 300  # Seconds requests to a host with an open circuit fail right away
+MAX_REDIRECTS = 5
+CHUNK_SIZE = 64 * 1024
+USER_AGENT = "CiefpTvProgram/1.3"
+
+# Result of a single channel download, status 304 means the cached copy is still current
+DownloadResult = namedtuple("DownloadResult", ["chan_id", "url", "path", "ok", "status", "size", "elapsed", "error",
+                                               "etag", "last_modified", "sha1"])
+
+
+class HTTPError(IOError):
+    """Unexpected HTTP status, only server errors and throttling are worth retrying."""
+
+    def __init__(self, status, message):
+        IOError.__init__(self, message)
+        self.status = status
+
+    @property
+    def transient(self):
+        return self.status >= 500 or self.status == 429
+
+
+class Cancelled(Exception):
+    pass
+
+
+def isTransient(error):
+    """True if a retry may fix the error: network trouble, timeouts and server side HTTP errors."""
+    if isinstance(error, HTTPError):
+        return error.transient
+    return isinstance(error, (OSError, http.client.HTTPException))
+
+
+class CircuitBreaker:
+    """Stops requests to a host after repeated transient failures, shared by all downloaders.
+
+    After threshold consecutive failures the circuit of the host opens and requests fail right away for
+    cooldown seconds. Then a single trial request is let through: success closes the circuit, failure opens
+    it for another cooldown and a cancelled trial (release) lets the next request try again.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN, clock=time.monotonic):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.hosts = {}  # host: [consecutive failures, open until, trial running]
+        self.trips = 0
+
+    def allow(self, host):
+        with self.lock:
+            state = self.hosts.get(host)
+            if state is None or state[0] < self.threshold:
+                return True
+            if state[2] or self.clock() < state[1]:
+                return False
+            state[2] = True
+            return True
+
+    def release(self, host):
+        """Forget the running trial of a host, for requests that ended without an answer either way."""
+        with self.lock:
+            state = self.hosts.get(host)
+            if state is not None:
+                state[2] = False
+
+    def success(self, host):
+        with self.lock:
+            self.hosts.pop(host, None)
+
+    def failure(self, host):
+        with self.lock:
+            state = self.hosts.setdefault(host, [0, 0, False])
+            state[0] += 1
+            state[2] = False
+            if state[0] >= self.threshold:
+                if state[0] == self.threshold:
+                    self.trips += 1
+                    logger.warning("Circuit for %s opened after %s failures", host, state[0])
+                state[1] = self.clock() + self.cooldown
+
+    def openHosts(self):
+        with self.lock:
+            now = self.clock()
+            return sorted(host for host, state in self.hosts.items() if state[0] >= self.threshold and now < state[1])
+
+
+hostBreaker = CircuitBreaker()
+
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections, pooled per (scheme, host, port)."""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.busy = set()
+
+    def acquire(self, key):
+        with self.lock:
+            conns = self.idle.get(key)
+            if conns:
+                conn = conns.pop()
+                self.busy.add(conn)
+                return conn, True
+        return self.connect(key), False
+
+    def connect(self, key):
+        scheme, host, port = key
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(host, port, timeout=self.timeout)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=self.timeout)
+        with self.lock:
+            self.busy.add(conn)
+        return conn
+
+    def release(self, key, conn):
+        with self.lock:
+            self.busy.discard(conn)
+            self.idle.setdefault(key, []).append(conn)
+
+    def close(self, conn):
+        with self.lock:
+            self.busy.discard(conn)
+        conn.close()
+
+    def abort(self):
+        """Wake up requests blocked on their sockets, they fail right away."""
+        with self.lock:
+            for conn in self.busy:
+                try:
+                    if conn.sock is not None:
+                        conn.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def closeAll(self):
+        with self.lock:
+            for conns in self.idle.values():
+                for conn in conns:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            self.idle = {}
+
+
+class EPGDownloader:
+    """Downloads EPG feeds concurrently, reusing connections per host.
+
+    Every request is bounded by request_deadline and retried with exponential backoff on transient errors,
+    hosts that keep failing are skipped through the circuit breaker.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, request_deadline=REQUEST_DEADLINE,
+                 retries=RETRIES, breaker=None):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.request_deadline = request_deadline
+        self.retries = retries
+        self.breaker = breaker or hostBreaker
+        self.pool = ConnectionPool(timeout)
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+        self.retried = 0
+        self.failed = 0
+
+    def cancel(self):
+        """Skip downloads that have not started yet and abort running ones."""
+        self.cancelled.set()
+        self.pool.abort()
+
+    def stats(self):
+        return {
+            "retries": self.retried,
+            "failed": self.failed,
+            "circuit_trips": self.breaker.trips,
+            "circuit_open": ", ".join(self.breaker.openHosts()) or "-",
+        }
+
+    def fetch(self, chan_id, url, dest, headers=None):
+        """Download url into dest and return a DownloadResult.
+
+        headers may carry If-None-Match/If-Modified-Since, dest is left untouched on a 304 and on failure.
+        """
+        start_time = time.time()
+        host = urllib.parse.urlsplit(url).hostname
+        attempt = 0
+        while True:
+            if self.cancelled.is_set():
+                return DownloadResult(chan_id, url, dest, False, None, 0, time.time() - start_time, "cancelled",
+                                      None, None, None)
+            if not self.breaker.allow(host):
+                error = f"Host {host} unavailable, circuit open"
+                break
+            try:
+                status, size, etag, last_modified, sha1 = self._fetch(url, dest, headers or {},
+                                                                      time.monotonic() + self.request_deadline)
+                self.breaker.success(host)
+                return DownloadResult(chan_id, url, dest, True, status, size, time.time() - start_time, None,
+                                      etag, last_modified, sha1)
+            except Exception as e:
+                if self.cancelled.is_set():
+                    self.breaker.release(host)  # Aborted by cancel(), says nothing about the host
+                    continue
+                error = str(e) or type(e).__name__
+                if not isTransient(e):
+                    self.breaker.success(host)  # The host answered
+                    break
+                self.breaker.failure(host)
+                if attempt >= self.retries:
+                    break
+            attempt += 1
+            delay = BACKOFF_BASE * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+            with self.lock:
+                self.retried += 1
+            logger.debug("Download of %s failed (%s), retry %s in %.1fs", chan_id, error, attempt, delay)
+            self.cancelled.wait(delay)
+        with self.lock:
+            self.failed += 1
+        logger.error("Error downloading EPG for %s from %s: %s", chan_id, url, error)
+        return DownloadResult(chan_id, url, dest, False, None, 0, time.time() - start_time, error,
+                              None, None, None)
+
+    def _fetch(self, url, dest, headers, deadline):
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urllib.parse.urlsplit(url)
+            scheme = parts.scheme.lower()
+            if scheme not in ("http", "https"):
+                raise ValueError(f"Unsupported URL scheme: {url}")
+            port = parts.port or (443 if scheme == "https" else 80)
+            key = (scheme, parts.hostname, port)
+            path = parts.path or "/"
+            if parts.query:
+                path += "?" + parts.query
+            response, conn = self._request(key, path, headers, deadline)
+            try:
+                if response.status in (301, 302, 303, 307, 308):
+                    location = response.getheader("Location")
+                    response.read()
+                    if not location:
+                        raise HTTPError(response.status, f"HTTP {response.status} without Location header")
+                    url = urllib.parse.urljoin(url, location)
+                    logger.debug("Redirected to %s", url)
+                    continue
+                etag = response.getheader("ETag")
+                last_modified = response.getheader("Last-Modified")
+                if response.status == 304:
+                    response.read()
+                    return response.status, 0, etag, last_modified, None
+                if response.status != 200:
+                    response.read()
+                    raise HTTPError(response.status, f"HTTP {response.status} {response.reason}")
+                size, sha1 = self._save(response, conn, dest, deadline)
+                return response.status, size, etag, last_modified, sha1
+            except Exception:
+                self.pool.close(conn)
+                conn = None
+                raise
+            finally:
+                if conn is not None:
+                    if response.will_close:
+                        self.pool.close(conn)
+                    else:
+                        self.pool.release(key, conn)
+        raise HTTPError(0, f"Too many redirects for {url}")
+
+    def _limitTimeout(self, conn, deadline):
+        """Let the next blocking socket operation wait no longer than the deadline allows."""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("Request deadline exceeded")
+        conn.timeout = min(self.timeout, remaining)
+        if conn.sock is not None:
+            conn.sock.settimeout(conn.timeout)
+
+    def _request(self, key, path, extra_headers, deadline):
+        headers = {"User-Agent": USER_AGENT, "Connection": "keep-alive"}
+        headers.update(extra_headers)
+        conn, reused = self.pool.acquire(key)
+        try:
+            self._limitTimeout(conn, deadline)
+            conn.request("GET", path, headers=headers)
+            return conn.getresponse(), conn
+        except (http.client.HTTPException, OSError):
+            self.pool.close(conn)
+            if not reused:
+                raise
+        # The server dropped an idle keep-alive connection, retry once on a fresh one
+        logger.debug("Stale connection to %s, reconnecting", key[1])
+        conn = self.pool.connect(key)
+        self._limitTimeout(conn, deadline)
+        conn.request("GET", path, headers=headers)
+        return conn.getresponse(), conn
+
+    def _save(self, response, conn, dest, deadline):
+        temp_file = dest + ".part"
+        size = 0
+        digest = hashlib.sha1()
+        try:
+            with open(temp_file, "wb") as f_out:
+                while True:
+                    if self.cancelled.is_set():
+                        raise Cancelled()
+                    self._limitTimeout(conn, deadline)
+                    chunk = response.read1(CHUNK_SIZE)  # Returns what arrived, so a trickle still meets the deadline
+                    if not chunk:
+                        response.read()  # Marks the response complete, so its connection can be reused
+                        break
+                    f_out.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+                if self.cancelled.is_set():
+                    raise Cancelled()
+                # A dropped connection ends the body early, keep the previous feed then
+                expected = response.getheader("Content-Length")
+                if expected and expected.isdigit() and int(expected) != size:
+                    raise http.client.IncompleteRead(b"", int(expected) - size)
+                # On disk before the rename, so a power cut leaves the old feed or the new one, never a torn file
+                f_out.flush()
+                os.fsync(f_out.fileno())
+            os.replace(temp_file, dest)
+        finally:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+        return size, digest.hexdigest()
+
+    def downloadAll(self, jobs, onResult=None, timeout=None):
+        """Download (chan_id, url, dest, headers) jobs, return ({chan_id: DownloadResult}, wall time).
+
+        onResult, if given, is called in the calling thread with each DownloadResult as soon as it completes.
+        Downloads still running after timeout seconds are cancelled and come back as "cancelled".
+        """
+        start_time = time.time()
+        results = {}
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                pending = set(executor.submit(self.fetch, *job) for job in jobs)
+                try:
+                    for future in as_completed(list(pending), timeout):
+                        pending.discard(future)
+                        self._collect(future, results, onResult)
+                except FuturesTimeout:
+                    logger.warning("EPG downloads exceeded the %ss deadline, cancelling the rest", timeout)
+                    self.cancel()
+                    for future in as_completed(pending):
+                        self._collect(future, results, onResult)
+        finally:
+            self.pool.closeAll()
+        wall_time = time.time() - start_time
+        failed = [r.chan_id for r in results.values() if not r.ok]
+        logger.debug("Downloaded %s/%s EPG feeds in %.2fs, failed: %s",
+                     len(results) - len(failed), len(results), wall_time, sorted(failed))
+        return results, wall_time
+
+    def _collect(self, future, results, onResult):
+        result = future.result()
+        results[result.chan_id] = result
+        logger.debug("Download %s for %s: %s bytes in %.2fs",
+                     "ok" if result.ok else "failed", result.chan_id, result.size, result.elapsed)
+        if onResult:
+            onResult(result)
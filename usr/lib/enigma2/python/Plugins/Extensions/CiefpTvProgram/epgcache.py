@@ -0,0 +1,188 @@
+import os
+import sys
+import mmap
+import array
+import struct
+import logging
+import tempfile
+from .schedule import ChannelSchedule
+
+logger = logging.getLogger(__name__)
+
+# Cache file layout (little endian):
+#   header   magic, format version, source size, source mtime (ns), entry count
+#   starts   int64 array of programme start times (epoch seconds), sorted
+#   stops    int64 array of programme stop times, 0 if unknown
+#   offsets  uint32 array of 2 * count + 1 offsets into the string blob (title, desc per entry)
+#   blob     UTF-8 strings
+MAGIC = b'CTVE'
+FORMAT_VERSION = 2
+HEADER = struct.Struct('<4sHqqI')
+
+
+def sourceSignature(path):
+    """Identify a feed file version by size and modification time."""
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def readArray(typecode, data, position, count):
+    values = array.array(typecode)
+    end = position + count * values.itemsize
+    values.frombytes(data[position:end])
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values, end
+
+
+def writeArray(f, values):
+    if sys.byteorder != 'little':
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    f.write(values.tobytes())
+
+
+class LazyDescriptions:
+    """Programme descriptions that stay in the cache file, only their byte ranges are kept in memory.
+
+    Behaves like the descs list of a ChannelSchedule. Reads check the file header first, so a cache file that
+    was rewritten in the meantime yields empty descriptions instead of text of other programmes.
+    """
+
+    def __init__(self, path, header, base, bounds):
+        self.path = path
+        self.header = header
+        self.base = base
+        self.bounds = bounds  # start, end offset into the blob per description
+
+    def __len__(self):
+        return len(self.bounds) // 2
+
+    def __iter__(self):
+        return iter(self[0:len(self)])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            first, last, step = index.indices(len(self))
+            if first >= last:
+                return []
+            values = self.read(first, last)
+            return values[::step] if step != 1 else values
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("description index out of range")
+        return self.read(index, index + 1)[0]
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            first, last, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("only contiguous ranges can be deleted")
+            del self.bounds[2 * first:2 * max(last, first)]
+        else:
+            if index < 0:
+                index += len(self)
+            del self.bounds[2 * index:2 * index + 2]
+
+    def read(self, first, last):
+        """Descriptions first..last - 1, read with a single file access."""
+        start = self.bounds[2 * first]
+        end = self.bounds[2 * last - 1]
+        try:
+            with open(self.path, 'rb') as f:
+                if f.read(len(self.header)) != self.header:
+                    logger.warning("EPG cache %s changed, descriptions no longer available", self.path)
+                    return [""] * (last - first)
+                f.seek(self.base + start)
+                data = f.read(end - start)
+        except Exception as e:
+            logger.error("Error reading descriptions from EPG cache %s: %s", self.path, e)
+            return [""] * (last - first)
+        return [data[self.bounds[2 * i] - start:self.bounds[2 * i + 1] - start].decode('utf-8')
+                for i in range(first, last)]
+
+
+class EPGCache:
+    """Pre-parsed EPG per channel, stored in a compact binary file so reopening skips XML parsing."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def path(self, chan_id):
+        return os.path.join(self.directory, f"{chan_id}.epgc")
+
+    def load(self, chan_id, source=None):
+        """Return the cached ChannelSchedule of a channel, or None if missing or outdated.
+
+        Without source the cached data is returned whatever feed version it was parsed from.
+        Titles are decoded right away, descriptions are left in the file (see LazyDescriptions).
+        """
+        cache_file = self.path(chan_id)
+        try:
+            signature = sourceSignature(source) if source else None
+            with open(cache_file, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    magic, version, size, mtime_ns, count = HEADER.unpack_from(data, 0)
+                    if magic != MAGIC or version != FORMAT_VERSION:
+                        logger.debug("EPG cache %s has unsupported format %s, rebuilding", cache_file, version)
+                        return None
+                    if signature and (size, mtime_ns) != signature:
+                        logger.debug("EPG cache %s is outdated, source changed: %s", cache_file, source)
+                        return None
+                    starts, position = readArray('q', data, HEADER.size, count)
+                    stops, position = readArray('q', data, position, count)
+                    offsets, position = readArray('I', data, position, 2 * count + 1)
+                    header = data[:HEADER.size]
+                    titles = [data[position + offsets[2 * i]:position + offsets[2 * i + 1]].decode('utf-8')
+                              for i in range(count)]
+            descs = LazyDescriptions(cache_file, header, position, offsets[1:])
+            return ChannelSchedule.fromColumns(starts, stops, titles, descs)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error("Error reading EPG cache %s: %s", cache_file, e)
+            return None
+
+    def isCurrent(self, chan_id, source):
+        """True if the cache of a channel was parsed from this version of source, without loading it."""
+        try:
+            with open(self.path(chan_id), 'rb') as f:
+                magic, version, size, mtime_ns, count = HEADER.unpack(f.read(HEADER.size))
+            return magic == MAGIC and version == FORMAT_VERSION and (size, mtime_ns) == sourceSignature(source)
+        except (OSError, struct.error):
+            return False
+
+    def store(self, chan_id, source, schedule):
+        """Write the ChannelSchedule of a channel, tagged with the signature of the feed it was parsed from."""
+        cache_file = self.path(chan_id)
+        temp_file = None
+        try:
+            size, mtime_ns = sourceSignature(source)
+            offsets = array.array('I', [0])
+            chunks = []
+            position = 0
+            for title, desc in zip(schedule.titles, schedule.descs):
+                for value in (title, desc):
+                    encoded = value.encode('utf-8')
+                    chunks.append(encoded)
+                    position += len(encoded)
+                    offsets.append(position)
+            # A temporary file of its own, writers of the same channel in other processes cannot clash
+            fd, temp_file = tempfile.mkstemp(prefix=f"{chan_id}.", suffix=".tmp", dir=self.directory)
+            os.fchmod(fd, 0o644)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, FORMAT_VERSION, size, mtime_ns, len(schedule)))
+                writeArray(f, schedule.starts)
+                writeArray(f, schedule.stops)
+                writeArray(f, offsets)
+                f.write(b''.join(chunks))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_file, cache_file)
+        except Exception as e:
+            logger.error("Error writing EPG cache %s: %s", cache_file, e)
+            if temp_file and os.path.exists(temp_file):
+                os.remove(temp_file)
@@ -0,0 +1,80 @@
+import time
+from bisect import bisect_right
+
+WINDOW_LINES = 60  # Lines materialized at once, about three screens of the EPG list
+EDGE_LINES = 10  # The window moves when the selection comes this close to an edge it can move past
+
+
+class EPGWindow:
+    """EPG lines of a channel as the MenuList shows them, built only around the selection.
+
+    The schedule is seen as virtual lines: a header before the first programme of each day and one line per
+    programme. Only a window of them exists as strings at a time, so selecting a channel or scrolling costs
+    the same whatever number of days is loaded. A window without schedule just shows message.
+    """
+
+    def __init__(self, schedule=None, message=None, size=WINDOW_LINES):
+        self.schedule = schedule if schedule else None
+        self.size = max(size, 2 * EDGE_LINES + 1)
+        days = self.schedule.dayBoundaries() if self.schedule else []
+        self.firsts = [first for first, day in days]
+        self.dates = [day.strftime('%d.%m.%Y') for first, day in days]
+        self.headers = [first + number for number, first in enumerate(self.firsts)]  # Virtual line of each header
+        self.total = len(self.schedule) + len(days) if self.schedule else 1
+        self.offset = 0  # Virtual line of lines[0]
+        self.lines = [message] if message is not None else []
+
+    def __len__(self):
+        return self.total
+
+    def lineOf(self, index):
+        """Virtual line of a programme."""
+        return index + bisect_right(self.firsts, index)
+
+    def indexAt(self, line):
+        """Programme shown at a virtual line, the first one of the day for a header, None without schedule."""
+        if self.schedule is None:
+            return None
+        day = bisect_right(self.headers, line) - 1
+        return min(line - day - (self.headers[day] != line), len(self.schedule) - 1)
+
+    def render(self, first, last):
+        """Lines for the virtual lines [first, last)."""
+        items = []  # (day, programme index or None for the header)
+        day = bisect_right(self.headers, first) - 1
+        for line in range(first, last):
+            if day + 1 < len(self.headers) and self.headers[day + 1] == line:
+                day += 1
+            items.append((day, None if self.headers[day] == line else line - day - 1))
+        indices = [index for day, index in items if index is not None]
+        if indices:
+            descs = self.schedule.descs[indices[0]:indices[-1] + 1]  # Read from the cache file in one go
+        lines = []
+        for day, index in items:
+            if index is None:
+                lines.append(f"--- {self.dates[day]} ---")
+                continue
+            time_formatted = time.strftime('%H:%M', time.localtime(self.schedule.starts[index]))
+            entry = f"{self.dates[day]} {time_formatted} - {self.schedule.titles[index]}"
+            desc = descs[index - indices[0]]
+            if desc:
+                entry += f"\n  {desc}"
+            lines.append(entry)
+        return lines
+
+    def moveTo(self, line):
+        """Make sure virtual line is materialized away from the window edges, return its position in lines."""
+        if self.schedule is None:
+            return 0
+        line = min(max(line, 0), self.total - 1)
+        position = line - self.offset
+        near_start = position < EDGE_LINES and self.offset > 0
+        near_end = position >= len(self.lines) - EDGE_LINES and self.offset + len(self.lines) < self.total
+        if not self.lines or position < 0 or position >= len(self.lines) or near_start or near_end:
+            self.offset = min(max(line - self.size // 2, 0), max(self.total - self.size, 0))
+            self.lines = self.render(self.offset, min(self.offset + self.size, self.total))
+        return line - self.offset
+
+    def step(self, position, delta):
+        """Position in lines after moving delta lines from position, wrapping around at both ends."""
+        return self.moveTo((self.offset + position + delta) % self.total)
@@ -0,0 +1,100 @@
+import os
+import json
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+REVALIDATE_AFTER = 6 * 3600  # Seconds before a feed is checked again with a conditional GET
+
+
+class FreshnessStore:
+    """Per-channel feed metadata (ETag, Last-Modified, fetch time, content hash) kept in a JSON file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            logger.debug("No freshness file found: %s", self.path)
+            return
+        try:
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)
+        except Exception as e:
+            logger.error("Error reading freshness file %s: %s", self.path, e)
+            self.entries = {}
+
+    def save(self):
+        temp_file = self.path + ".tmp"
+        try:
+            with open(temp_file, 'w') as f:
+                json.dump(self.entries, f, indent=1, sort_keys=True)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_file, self.path)
+        except Exception as e:
+            logger.error("Error writing freshness file %s: %s", self.path, e)
+
+    def get(self, chan_id):
+        return self.entries.get(chan_id, {})
+
+    def isStale(self, chan_id, now=None, max_age=REVALIDATE_AFTER):
+        """True if the channel was never fetched, its last fetch failed or it is due for revalidation."""
+        entry = self.entries.get(chan_id)
+        if not entry or not entry.get("ok"):
+            return True
+        now = time.time() if now is None else now
+        return now - entry.get("checked_at", 0) >= max_age
+
+    def conditionalHeaders(self, chan_id):
+        entry = self.entries.get(chan_id, {})
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def recordSuccess(self, chan_id, etag, last_modified, sha1, now=None):
+        """Store metadata of a fresh download, returns True if the content changed."""
+        now = time.time() if now is None else now
+        previous = self.entries.get(chan_id, {})
+        changed = previous.get("sha1") != sha1
+        self.entries[chan_id] = {
+            "ok": True,
+            "etag": etag,
+            "last_modified": last_modified,
+            "sha1": sha1,
+            "fetched_at": now if changed else previous.get("fetched_at", now),
+            "checked_at": now,
+        }
+        return changed
+
+    def recordNotModified(self, chan_id, etag=None, last_modified=None, now=None):
+        entry = self.entries.setdefault(chan_id, {})
+        entry["ok"] = True
+        entry.pop("error", None)
+        entry["checked_at"] = time.time() if now is None else now
+        if etag:
+            entry["etag"] = etag
+        if last_modified:
+            entry["last_modified"] = last_modified
+
+    def recordFailure(self, chan_id, error, now=None):
+        entry = self.entries.setdefault(chan_id, {})
+        entry["ok"] = False
+        entry["error"] = error
+        entry["checked_at"] = time.time() if now is None else now
+
+    def record(self, result):
+        """Update a channel from a DownloadResult, a cancelled download leaves it as it was."""
+        if result.status == 304:
+            self.recordNotModified(result.chan_id, result.etag, result.last_modified)
+        elif result.ok:
+            self.recordSuccess(result.chan_id, result.etag, result.last_modified, result.sha1)
+        elif result.error != "cancelled":
+            # Retried on the next refresh instead of waiting for the revalidation window
+            self.recordFailure(result.chan_id, result.error)
@@ -0,0 +1,153 @@
+import os
+import sys
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from .xmltv import iterProgrammes
+from .schedule import ChannelSchedule
+from .epgcache import EPGCache
+from .search import buildPostings
+from .stats import PipelineStats
+
+logger = logging.getLogger(__name__)
+
+MAX_WORKERS = 3  # Parser processes at most, one core is always left to the UI and the downloads
+
+# Outcome of one feed: changed slots and search postings per channel ID, the stats report of the job and the
+# channel IDs of the feed that were not asked for
+IngestResult = namedtuple("IngestResult", ["path", "changes", "postings", "stats", "unmatched"])
+
+
+def defaultWorkers():
+    return max(0, min(MAX_WORKERS, (os.cpu_count() or 1) - 1))
+
+
+def parseFeed(path, channel_ids, since, stats=None, label=None):
+    """Stream-parse an XMLTV feed into {chan_id: ChannelSchedule} of programmes ending at or after since.
+
+    The IDs of channels in the feed but not in channel_ids are returned as well.
+    """
+    entries = {}
+    unmatched = set()
+    for chan_id, start, stop, title, desc in iterProgrammes(path, channel_ids, unmatched, stats, label):
+        if (stop or start) >= since:
+            entries.setdefault(chan_id, []).append((start, stop, title, desc))
+    return {chan_id: ChannelSchedule(programmes) for chan_id, programmes in entries.items()}, unmatched
+
+
+def ingestFeed(path, channel_ids, cache_dir, cache_since, window):
+    """Parse a feed, merge it into the binary cache of its channels and build their search postings.
+
+    Runs in a parser process, so everything it hands back is small and picklable: the schedules themselves
+    are read back from the cache. Postings cover the programmes within window (since, until).
+    """
+    label = next(iter(channel_ids)) if len(channel_ids) == 1 else None
+    stats = PipelineStats()
+    with stats.span("parse", label):
+        parsed, unmatched = parseFeed(path, channel_ids, cache_since, stats, label)
+    cache = EPGCache(cache_dir)
+    changes = {}
+    postings = {}
+    for chan_id in channel_ids:
+        schedule = parsed.get(chan_id) or ChannelSchedule()
+        with stats.span("merge", chan_id):
+            previous = cache.load(chan_id)
+            if previous is not None:
+                schedule, changes[chan_id] = previous.merge(schedule)
+                schedule.retain(cache_since, sys.maxsize)
+            else:
+                changes[chan_id] = len(schedule)
+        with stats.span("cache_store", chan_id):
+            cache.store(chan_id, path, schedule)
+        schedule.retain(*window)
+        if len(schedule):
+            with stats.span("index", chan_id):
+                postings[chan_id] = buildPostings(schedule)
+    return IngestResult(path, changes, postings, stats.report(), unmatched)
+
+
+class ParsePool:
+    """Runs ingestFeed() jobs next to the downloads, on their own cores.
+
+    Worker processes are forked when the pool is created, before any download thread exists, and live for
+    one refresh. Where processes are not available (no fork, no POSIX semaphores) or workers is 0, jobs run
+    in a single thread instead, which still overlaps parsing with the network. Jobs sharing a channel run one
+    after the other in submit order, so they never merge into the same cache file at once.
+    """
+
+    def __init__(self, workers=None):
+        workers = defaultWorkers() if workers is None else workers
+        self.executor = None
+        self.processes = 0
+        self.futures = {}  # Future: (key, channel IDs) of the job
+        self.busy = set()  # Channel IDs of running jobs
+        self.waiting = []  # (key, job arguments) held back until their channels are free
+        if workers > 0:
+            try:
+                import multiprocessing
+                self.executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork"))
+                self.executor.submit(os.getpid).result()  # Forks all workers now
+                self.processes = workers
+            except Exception as e:
+                logger.debug("No parser processes (%s), parsing in a thread", e)
+                if self.executor is not None:
+                    self.executor.shutdown(wait=False)
+                self.executor = None
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        logger.debug("Parse pool with %s processes", self.processes)
+
+    def __len__(self):
+        return len(self.futures) + len(self.waiting)
+
+    def submit(self, key, path, channel_ids, cache_dir, cache_since, window):
+        """Queue ingestFeed() of a feed, key comes back with its result."""
+        job = (path, frozenset(channel_ids), cache_dir, cache_since, window)  # A set keeps ID lookups O(1)
+        if self.isBlocked(job[1]):
+            logger.debug("Parsing of %s waits for a running job of the same channels", path)
+            self.waiting.append((key, job))
+        else:
+            self.start(key, job)
+
+    def isBlocked(self, channel_ids):
+        """True while a running job or an earlier waiting one has any of channel_ids."""
+        return bool(channel_ids & self.busy) or any(channel_ids & job[1] for key, job in self.waiting)
+
+    def start(self, key, job):
+        self.futures[self.executor.submit(ingestFeed, *job)] = (key, job[1])
+        self.busy |= job[1]
+
+    def release(self, channel_ids):
+        """Start the waiting jobs a finished one was holding back."""
+        self.busy -= channel_ids
+        waiting, self.waiting = self.waiting, []
+        for key, job in waiting:
+            if self.isBlocked(job[1]):
+                self.waiting.append((key, job))
+            else:
+                self.start(key, job)
+
+    def completed(self, block=False):
+        """Yield (key, IngestResult or the exception it raised) of finished jobs.
+
+        With block all remaining jobs are waited for, otherwise only those already done are returned.
+        """
+        while self.futures:
+            done, _ = wait(list(self.futures), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+            if not done:
+                return
+            for future in done:
+                key, channel_ids = self.futures.pop(future)
+                self.release(channel_ids)
+                try:
+                    yield key, future.result()
+                except Exception as e:
+                    yield key, e
+
+    def shutdown(self, cancel=False):
+        if cancel:
+            for future in self.futures:
+                future.cancel()
+            self.futures = {}
+            self.waiting = []
+        self.executor.shutdown(wait=not cancel)
@@ -0,0 +1,91 @@
+import time
+import queue
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_FILE = "/tmp/ciefp_tvprogram.log"
+LOG_MAX_BYTES = 256 * 1024  # /tmp is RAM on most images, keep the log small
+LOG_BACKUPS = 1
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+LOG_LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+}
+RATE_LIMIT_INTERVAL = 5.0  # Seconds over which repeats of the same message are counted
+RATE_LIMIT_BURST = 5  # Repeats of the same message let through per interval
+
+# Parent logger of all plugin modules
+PACKAGE_LOGGER = __name__.rpartition('.')[0] or __name__
+
+listener = None
+
+
+class RateLimitFilter(logging.Filter):
+    """Let through at most RATE_LIMIT_BURST records of the same message template per interval.
+
+    The first record after a suppressed stretch reports how many were dropped, so hot paths (key presses,
+    per-channel loops) cannot flood the log.
+    """
+
+    def __init__(self, interval=RATE_LIMIT_INTERVAL, burst=RATE_LIMIT_BURST):
+        logging.Filter.__init__(self)
+        self.interval = interval
+        self.burst = burst
+        self.lock = threading.Lock()
+        self.windows = {}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.msg)
+        now = time.time()
+        with self.lock:
+            started, count, suppressed = self.windows.get(key, (now, 0, 0))
+            if now - started >= self.interval:
+                started, count = now, 0
+            if count >= self.burst:
+                self.windows[key] = (started, count, suppressed + 1)
+                return False
+            self.windows[key] = (started, count + 1, 0)
+        if suppressed:
+            record.msg = f"{record.msg} (suppressed {suppressed} similar messages)"
+        return True
+
+
+def setupLogging(level="warning", log_file=LOG_FILE):
+    """Route plugin logs through a queue to a rotating file, so disk writes happen off the calling thread."""
+    global listener
+    logger = logging.getLogger(PACKAGE_LOGGER)
+    setLogLevel(level)
+    if listener is not None:
+        return
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler()]
+    try:
+        handlers.append(RotatingFileHandler(log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS))
+    except Exception as e:
+        logger.error("Error opening log file %s: %s", log_file, e)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    log_queue = queue.Queue(-1)
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter())
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+    listener = QueueListener(log_queue, *handlers)
+    listener.start()
+
+
+def setLogLevel(level):
+    logging.getLogger(PACKAGE_LOGGER).setLevel(LOG_LEVELS.get(level, logging.WARNING))
+
+
+def stopLogging():
+    """Flush queued records and stop the writer thread."""
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
@@ -0,0 +1,92 @@
+import sys
+import heapq
+from bisect import bisect_left
+from .schedule import ChannelSchedule
+
+RELEASE_HORIZON = 6 * 3600  # Seconds of programmes ahead a released channel keeps, see release()
+
+
+class NowNextIndex:
+    """Running and next programme of every channel, kept current at programme boundaries.
+
+    A channel is looked up in its schedule once when it is set. After that only the channels whose programme
+    ended are looked up again, in boundary order from a heap. nextBoundary() is the earliest change of all
+    channels, so a single timer keeps the whole index current.
+    """
+
+    def __init__(self):
+        self.schedules = {}
+        self.current = {}  # channel_name: (index of the running programme, valid_until)
+        self.boundaries = []  # Heap of (valid_until, channel_name), outdated pairs are skipped when popped
+        self.released = set()  # Channels that only keep a slice of their schedule
+        self.listeners = []
+
+    def __len__(self):
+        return len(self.schedules)
+
+    def update(self, channel_name, schedule, now):
+        """Set or replace the schedule of a channel."""
+        self.schedules[channel_name] = schedule
+        self.released.discard(channel_name)
+        self.locate(channel_name, now)
+        if len(self.boundaries) > 4 * len(self.current):
+            self.boundaries = [(valid_until, name) for name, (index, valid_until) in self.current.items()
+                               if valid_until < sys.maxsize]
+            heapq.heapify(self.boundaries)
+        self.notify({channel_name})
+
+    def release(self, channel_name, now, horizon=RELEASE_HORIZON):
+        """Keep only the programmes of a channel from the running one to horizon seconds ahead, so the full
+        schedule can be freed. The slice has to be renewed with update() before it runs out, see expiring().
+        """
+        schedule = self.schedules.get(channel_name)
+        if schedule is None:
+            return
+        first = max(schedule.currentIndex(now), 0)
+        last = min(bisect_left(schedule.starts, now + horizon) + 1, len(schedule))
+        self.schedules[channel_name] = ChannelSchedule.fromColumns(
+            schedule.starts[first:last], schedule.stops[first:last], schedule.titles[first:last], [""] * (last - first))
+        self.released.add(channel_name)
+        self.locate(channel_name, now)
+
+    def expiring(self, now, margin):
+        """Released channels whose slice ends within margin seconds."""
+        return [channel_name for channel_name in self.released
+                if len(self.schedules[channel_name]) and self.schedules[channel_name].starts[-1] < now + margin]
+
+    def locate(self, channel_name, now):
+        index, valid_from, valid_until = self.schedules[channel_name].currentWindow(now)
+        self.current[channel_name] = (index, valid_until)
+        if valid_until < sys.maxsize:
+            heapq.heappush(self.boundaries, (valid_until, channel_name))
+
+    def advance(self, now):
+        """Move channels whose programme ended by now to their next one, return their names."""
+        changed = set()
+        while self.boundaries and self.boundaries[0][0] <= now:
+            valid_until, channel_name = heapq.heappop(self.boundaries)
+            if self.current.get(channel_name, (None, None))[1] != valid_until:
+                continue
+            self.locate(channel_name, now)
+            changed.add(channel_name)
+        if changed:
+            self.notify(changed)
+        return changed
+
+    def nextBoundary(self):
+        """Epoch of the next programme change on any channel, None if there is none."""
+        return self.boundaries[0][0] if self.boundaries else None
+
+    def row(self, channel_name):
+        """((start, title) running, (start, title) next) of a channel, None where there is no programme."""
+        schedule = self.schedules.get(channel_name)
+        if schedule is None:
+            return None, None
+        index = self.current[channel_name][0]
+        running = (schedule.starts[index], schedule.titles[index]) if index >= 0 else None
+        following = (schedule.starts[index + 1], schedule.titles[index + 1]) if index + 1 < len(schedule) else None
+        return running, following
+
+    def notify(self, channel_names):
+        for listener in self.listeners:
+            listener(channel_names)
@@ -0,0 +1,94 @@
+import os
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CAPACITY = 12  # Decoded picons kept in memory
+
+
+class PiconCache:
+    """LRU of loaded picon pixmaps with a negative cache for channels without a picon file.
+
+    The picon directory is listed once, so lookups never touch the filesystem for files that do not exist.
+    loader turns a file path into a pixmap (LoadPixmap on the receiver).
+    """
+
+    def __init__(self, directory, loader, placeholder=None, capacity=DEFAULT_CAPACITY):
+        self.directory = directory
+        self.loader = loader
+        self.placeholder = placeholder
+        self.placeholderPixmap = None
+        self.capacity = max(1, capacity)
+        self.entries = OrderedDict()
+        self.missing = set()
+        self.hits = 0
+        self.misses = 0
+        try:
+            self.available = set(os.listdir(directory))
+            logger.debug("Indexed %s picon files in %s", len(self.available), directory)
+        except Exception as e:
+            logger.error("Error listing picon directory %s: %s", directory, e)
+            self.available = set()
+
+    def get(self, chan_id):
+        """Return the pixmap of a channel, the placeholder if it has none."""
+        pixmap = self.entries.get(chan_id)
+        if pixmap is not None:
+            self.entries.move_to_end(chan_id)
+            self.hits += 1
+            return pixmap
+        self.misses += 1
+        if chan_id not in self.missing:
+            pixmap = self.load(chan_id)
+            if pixmap is not None:
+                return pixmap
+        return self.getPlaceholder()
+
+    def load(self, chan_id):
+        picon_name = f"{chan_id}.png"
+        if picon_name not in self.available:
+            logger.warning("Picon file not found: %s", os.path.join(self.directory, picon_name))
+            self.missing.add(chan_id)
+            return None
+        filename = os.path.join(self.directory, picon_name)
+        try:
+            pixmap = self.loader(filename)
+        except Exception as e:
+            logger.error("Error loading picon %s: %s", filename, e)
+            pixmap = None
+        if pixmap is None:
+            logger.warning("Failed to load pixmap for picon: %s", filename)
+            self.missing.add(chan_id)
+            return None
+        self.entries[chan_id] = pixmap
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+        return pixmap
+
+    def getPlaceholder(self):
+        if self.placeholderPixmap is None and self.placeholder:
+            placeholder, self.placeholder = self.placeholder, None  # Only tried once
+            if os.path.exists(placeholder):
+                try:
+                    self.placeholderPixmap = self.loader(placeholder)
+                except Exception as e:
+                    logger.error("Error loading placeholder picon: %s", e)
+            else:
+                logger.warning("Placeholder picon not found: %s", placeholder)
+        return self.placeholderPixmap
+
+    def prefetch(self, chan_ids):
+        """Load the picons of chan_ids that are not cached yet, without touching the LRU order of the rest."""
+        for chan_id in chan_ids:
+            if chan_id not in self.entries and chan_id not in self.missing:
+                self.load(chan_id)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "missing": len(self.missing),
+            "size": len(self.entries),
+            "capacity": self.capacity,
+        }
@@ -4,220 +4,531 @@ from Components.Label import Label
 from Components.Pixmap import Pixmap
 from Components.MenuList import MenuList
 from Components.ScrollLabel import ScrollLabel
+from Components.ConfigList import ConfigListScreen
+from Components.config import config, ConfigSubsection, ConfigSelection, ConfigYesNo, getConfigListEntry
+from Screens.VirtualKeyBoard import VirtualKeyBoard
 from Tools.LoadPixmap import LoadPixmap
+from enigma import eTimer
 import sys
 import platform
 import os
-import gzip
-import urllib.request
-import xml.etree.ElementTree as ET
 import datetime
 import time
-import io
 import logging
+import queue
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from .downloader import EPGDownloader
+from .freshness import FreshnessStore
+from .epgcache import EPGCache, sourceSignature
+from .schedule import localMidnight, retentionWindow
+from .rendercache import RenderCache
+from .piconcache import PiconCache
+from .logsetup import setupLogging, setLogLevel, stopLogging
+from .stats import PipelineStats
+from .scheduler import RefreshScheduler, CHECK_INTERVAL
+from .nownext import NowNextIndex, RELEASE_HORIZON
+from .search import SearchIndex, buildPostings, postingsSize
+from .epgwindow import EPGWindow
+from .ingest import ParsePool
+from .storage import DEFAULT_EPG_DIR, loadChannels, readSettings, feedFile, freshnessFile, cacheDir, statsFile, \
+    findEPGImportFile, removeLegacyFiles
 
-# Setup logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('/tmp/ciefp_tvprogram.log'),
-        logging.StreamHandler()
-    ]
-)
+STORAGE_MOUNTS = ["/media/hdd", "/media/usb", "/media/mmc"]  # Offered as EPG storage when mounted
+
+
+def storageMount(path):
+    """The storage mount path lies on, None for RAM."""
+    return next((mount for mount in STORAGE_MOUNTS if path == mount or path.startswith(mount + "/")), None)
+
+
+def storageChoices():
+    choices = [(DEFAULT_EPG_DIR, "RAM (/tmp)")]
+    for mount in STORAGE_MOUNTS:
+        if os.path.ismount(mount):
+            choices.append((os.path.join(mount, "CiefpTvProgram"), mount))
+    # Plugins load before USB and HDD mounts may be up, the saved location must not fall back to the default
+    saved = readSettings().get("storagePath")
+    if saved and saved not in [path for path, label in choices]:
+        choices.append((saved, f"{storageMount(saved) or saved} (nije montirano)"))
+    return choices
+
+
+# Plugin settings
+config.plugins.CiefpTvProgram = ConfigSubsection()
+config.plugins.CiefpTvProgram.logLevel = ConfigSelection(default="warning", choices=[
+    ("debug", "Debug"),
+    ("info", "Info"),
+    ("warning", "Warning"),
+    ("error", "Error"),
+])
+config.plugins.CiefpTvProgram.traceMemory = ConfigYesNo(default=False)  # tracemalloc peak during refresh
+config.plugins.CiefpTvProgram.retentionHours = ConfigSelection(default="2", choices=[
+    ("0", "0 h"),
+    ("1", "1 h"),
+    ("2", "2 h"),
+    ("6", "6 h"),
+    ("12", "12 h"),
+])  # Already finished programmes kept in memory
+config.plugins.CiefpTvProgram.retentionDays = ConfigSelection(default="7", choices=[
+    ("1", "1 dan"),
+    ("2", "2 dana"),
+    ("3", "3 dana"),
+    ("5", "5 dana"),
+    ("7", "7 dana"),
+])  # Days ahead kept in memory, today included
+config.plugins.CiefpTvProgram.backgroundRefresh = ConfigYesNo(default=True)  # Revalidate stale feeds in quiet hours
+config.plugins.CiefpTvProgram.quietStart = ConfigSelection(default="3", choices=[(str(h), f"{h:02d}:00") for h in range(24)])
+config.plugins.CiefpTvProgram.quietEnd = ConfigSelection(default="6", choices=[(str(h), f"{h:02d}:00") for h in range(24)])
+config.plugins.CiefpTvProgram.storagePath = ConfigSelection(default=DEFAULT_EPG_DIR, choices=storageChoices())
+config.plugins.CiefpTvProgram.memoryBudget = ConfigSelection(default="16", choices=[
+    ("4", "4 MB"),
+    ("8", "8 MB"),
+    ("16", "16 MB"),
+    ("32", "32 MB"),
+    ("64", "64 MB"),
+])  # Parsed schedules kept in memory between plugin opens, search postings are never evicted and not counted
+config.plugins.CiefpTvProgram.parallelParse = ConfigYesNo(default=True)  # Parse feeds in processes on the other cores
+
+# Setup logging, written to a size-bounded file by a background thread
+setupLogging(config.plugins.CiefpTvProgram.logLevel.value)
+config.plugins.CiefpTvProgram.logLevel.addNotifier(lambda element: setLogLevel(element.value), initial_call=False)
 logger = logging.getLogger(__name__)
 
 # Diagnostic logging for Python environment
-logger.debug(f"Python version: {sys.version}")
-logger.debug(f"Python path: {sys.path}")
-logger.debug(f"Platform: {platform.platform()}")
+logger.debug("Python version: %s", sys.version)
+logger.debug("Python path: %s", sys.path)
+logger.debug("Platform: %s", platform.platform())
 
 PLUGIN_PATH = "/usr/lib/enigma2/python/Plugins/Extensions/CiefpTvProgram/"
 PICON_PATH = os.path.join(PLUGIN_PATH, "picon/")  # Picon directory
 PLACEHOLDER_PICON = os.path.join(PICON_PATH, "placeholder.png")  # Placeholder picon
-EPG_DIR = "/tmp/CiefpTvProgram"  # EPG storage directory
-EPGIMPORT_FILE = "/etc/epgimport/rytecSRB_Basic.xml"
-LAST_UPDATE_FILE = os.path.join(EPG_DIR, "last_update.txt")  # File to track last update
-
-# Channel list based on lista.txt (no service references needed)
-CHANNEL_LIST_DATA = [
-    "RTS1",
-    "RTS2",
-    "B92",
-    "Prva",
-    "Pink",
-    "Nova S",
-    "HTV1",
-    "HTV2",
-    "HTV3",
-    "HTV4",
-    "Nova TV",
-    "RTL",
-    "RTL2",
-    "Doma TV",
-    "Plava TV",
-    "Vinkovačka TV",
-    "TV Zapad",
-    "SLO1",
-    "SLO2",
-    "SLO3",
-    "Nova M",
-    "Al Jazeera Balkans",
-    "RTRS",
-    "BHT1",
-    "FTV",
-    "OBN",
-    "Hayat",
-    "Nova BH",
-    "Cartoon Network",
-    "Disney Channel",
-    "Kika",
-    "MTV 00",
-    "CMC Music",
-    "HBO",
-    "SciFi",
-    "Cinestar",
-    "Discovery",
-    "Eurosport",
-    "Sport Klub HR",
-    "Arena Sport 1 HR",
-    "Arena Sport 1 BH",
-    "Arena Sport 1",
-    "Arena Sport 2",
-    "Arena Sport 3",
-    "CNN",
-    "Euronews",
-    "Sky News",
-    "BBC1",
-    "CNBC",
-    "Bloomberg",
-    "RAI1",
-    "RTL DE",
-    "PRO7",
-    "Kabel1",
-    "Sat1",
-    "ZDF"
-]
-
-# EPG URLs from epg_list.txt
-EPG_URLS = {
-    "rts1.sr": "https://tvprofil.net/xmltv/data/rts1.sr/weekly_rts1.sr_tvprofil.net.xml.gz",
-    "rts2.sr": "https://tvprofil.net/xmltv/data/rts2.sr/weekly_rts2.sr_tvprofil.net.xml.gz",
-    "b92.sr": "https://tvprofil.net/xmltv/data/b92.sr/weekly_b92.sr_tvprofil.net.xml.gz",
-    "prva-srpska-tv.sr": "https://tvprofil.net/xmltv/data/prva-srpska-tv.sr/weekly_prva-srpska-tv.sr_tvprofil.net.xml.gz",
-    "pink.sr": "https://tvprofil.net/xmltv/data/pink.sr/weekly_pink.sr_tvprofil.net.xml.gz",
-    "nova-s.sr": "https://tvprofil.net/xmltv/data/nova-s.sr/weekly_nova-s.sr_tvprofil.net.xml.gz",
-    "htv1.hr": "https://tvprofil.net/xmltv/data/htv1.hr/weekly_htv1.hr_tvprofil.net.xml.gz",
-    "htv2.hr": "https://tvprofil.net/xmltv/data/htv2.hr/weekly_htv2.hr_tvprofil.net.xml.gz",
-    "htv3.hr": "https://tvprofil.net/xmltv/data/htv3.hr/weekly_htv3.hr_tvprofil.net.xml.gz",
-    "htv4.hr": "https://tvprofil.net/xmltv/data/htv4.hr/weekly_htv4.hr_tvprofil.net.xml.gz",
-    "nova.hr": "https://tvprofil.net/xmltv/data/nova.hr/weekly_nova.hr_tvprofil.net.xml.gz",
-    "rtl.hr": "https://tvprofil.net/xmltv/data/rtl.hr/weekly_rtl.hr_tvprofil.net.xml.gz",
-    "rtl2.hr": "https://tvprofil.net/xmltv/data/rtl2.hr/weekly_rtl2.hr_tvprofil.net.xml.gz",
-    "doma-tv.movie": "https://tvprofil.net/xmltv/data/doma-tv.movie/weekly_doma-tv.movie_tvprofil.net.xml.gz",
-    "plava-televizija.hr": "https://tvprofil.net/xmltv/data/plava-televizija.hr/weekly_plava-televizija.hr_tvprofil.net.xml.gz",
-    "vinkovacka-tv.hr": "https://tvprofil.net/xmltv/data/vinkovacka-tv.hr/weekly_vinkovacka-tv.hr_tvprofil.net.xml.gz",
-    "tv-zapad.hr": "https://tvprofil.net/xmltv/data/tv-zapad.hr/weekly_tv-zapad.hr_tvprofil.net.xml.gz",
-    "slo1.si": "https://tvprofil.net/xmltv/data/slo1.si/weekly_slo1.si_tvprofil.net.xml.gz",
-    "slo2.si": "https://tvprofil.net/xmltv/data/slo2.si/weekly_slo2.si_tvprofil.net.xml.gz",
-    "slo3.si": "https://tvprofil.net/xmltv/data/slo3.si/weekly_slo3.si_tvprofil.net.xml.gz",
-    "nova-m.cg": "https://tvprofil.net/xmltv/data/nova-m.cg/weekly_nova-m.cg_tvprofil.net.xml.gz",
-    "al-jazeera-balkans.info": "https://tvprofil.net/xmltv/data/al-jazeera-balkans.info/weekly_al-jazeera-balkans.info_tvprofil.net.xml.gz",
-    "rtrs.ba": "https://tvprofil.net/xmltv/data/rtrs.ba/weekly_rtrs.ba_tvprofil.net.xml.gz",
-    "bht1.ba": "https://tvprofil.net/xmltv/data/bht1.ba/weekly_bht1.ba_tvprofil.net.xml.gz",
-    "ftv.ba": "https://tvprofil.net/xmltv/data/ftv.ba/weekly_ftv.ba_tvprofil.net.xml.gz",
-    "obn.ba": "https://tvprofil.net/xmltv/data/obn.ba/weekly_obn.ba_tvprofil.net.xml.gz",
-    "hayat-tv.ba": "https://tvprofil.net/xmltv/data/hayat-tv.ba/weekly_hayat-tv.ba_tvprofil.net.xml.gz",
-    "nova-bh.ba": "https://tvprofil.net/xmltv/data/nova-bh.ba/weekly_nova-bh.ba_tvprofil.net.xml.gz",
-    "cartoon-network.toons": "https://tvprofil.net/xmltv/data/cartoon-network.toons/weekly_cartoon-network.toons_tvprofil.net.xml.gz",
-    "disney-channel.toons": "https://tvprofil.net/xmltv/data/disney-channel.toons/weekly_disney-channel.toons_tvprofil.net.xml.gz",
-    "kika.toons": "https://tvprofil.net/xmltv/data/kika.toons/weekly_kika.toons_tvprofil.net.xml.gz",
-    "mtv00s.music": "https://tvprofil.net/xmltv/data/mtv00s.music/weekly_mtv00s.music_tvprofil.net.xml.gz",
-    "cmc.music": "https://tvprofil.net/xmltv/data/cmc.music/weekly_cmc.music_tvprofil.net.xml.gz",
-    "hbo.movie": "https://tvprofil.net/xmltv/data/hbo.movie/weekly_hbo.movie_tvprofil.net.xml.gz",
-    "scifi.movie": "https://tvprofil.net/xmltv/data/scifi.movie/weekly_scifi.movie_tvprofil.net.xml.gz",
-    "cinestar-tv.movie": "https://tvprofil.net/xmltv/data/cinestar-tv.movie/weekly_cinestar-tv.movie_tvprofil.net.xml.gz",
-    "discovery-europe.doc": "https://tvprofil.net/xmltv/data/discovery-europe.doc/weekly_discovery-europe.doc_tvprofil.net.xml.gz",
-    "eurosport.sport": "https://tvprofil.net/xmltv/data/eurosport.sport/weekly_eurosport.sport_tvprofil.net.xml.gz",
-    "sportklub-hr.sport": "https://tvprofil.net/xmltv/data/sportklub-hr.sport/weekly_sportklub-hr.sport_tvprofil.net.xml.gz",
-    "tv-arena-sport-1-hr.sport": "https://tvprofil.net/xmltv/data/tv-arena-sport-1-hr.sport/weekly_tv-arena-sport-1-hr.sport_tvprofil.net.xml.gz",
-    "arena-sport-1-ba.sport": "https://tvprofil.net/xmltv/data/arena-sport-1-ba.sport/weekly_arena-sport-1-ba.sport_tvprofil.net.xml.gz",
-    "tv-arena-sport-1.sport": "https://tvprofil.net/xmltv/data/tv-arena-sport-1.sport/weekly_tv-arena-sport-1.sport_tvprofil.net.xml.gz",
-    "tv-arena-sport-2.sport": "https://tvprofil.net/xmltv/data/tv-arena-sport-2.sport/weekly_tv-arena-sport-2.sport_tvprofil.net.xml.gz",
-    "tv-arena-sport-3.sport": "https://tvprofil.net/xmltv/data/tv-arena-sport-3.sport/weekly_tv-arena-sport-3.sport_tvprofil.net.xml.gz",
-    "cnn.info": "https://tvprofil.net/xmltv/data/cnn.info/weekly_cnn.info_tvprofil.net.xml.gz",
-    "euronews.info": "https://tvprofil.net/xmltv/data/euronews.info/weekly_euronews.info_tvprofil.net.xml.gz",
-    "skynews.info": "https://tvprofil.net/xmltv/data/skynews.info/weekly_skynews.info_tvprofil.net.xml.gz",
-    "bbc1.uk": "https://tvprofil.net/xmltv/data/bbc1.uk/weekly_bbc1.uk_tvprofil.net.xml.gz",
-    "cnbc.info": "https://tvprofil.net/xmltv/data/cnbc.info/weekly_cnbc.info_tvprofil.net.xml.gz",
-    "bloomberg.info": "https://tvprofil.net/xmltv/data/bloomberg.info/weekly_bloomberg.info_tvprofil.net.xml.gz",
-    "rai-1.it": "https://tvprofil.net/xmltv/data/rai-1.it/weekly_rai-1.it_tvprofil.net.xml.gz",
-    "rtl-de.de": "https://tvprofil.net/xmltv/data/rtl-de.de/weekly_rtl-de.de_tvprofil.net.xml.gz",
-    "pro-7.de": "https://tvprofil.net/xmltv/data/pro-7.de/weekly_pro-7.de_tvprofil.net.xml.gz",
-    "kabel-1.de": "https://tvprofil.net/xmltv/data/kabel-1.de/weekly_kabel-1.de_tvprofil.net.xml.gz",
-    "sat-1.de": "https://tvprofil.net/xmltv/data/sat-1.de/weekly_sat-1.de_tvprofil.net.xml.gz",
-    "zdf.de": "https://tvprofil.net/xmltv/data/zdf.de/weekly_zdf.de_tvprofil.net.xml.gz"
-}
-
-# Channel ID mapping based on lista.txt
-CHANNEL_ID_MAPPING = {
-    "rts1.sr": "RTS1",
-    "rts2.sr": "RTS2",
-    "b92.sr": "B92",
-    "prva-srpska-tv.sr": "Prva",
-    "pink.sr": "Pink",
-    "nova-s.sr": "Nova S",
-    "htv1.hr": "HTV1",
-    "htv2.hr": "HTV2",
-    "htv3.hr": "HTV3",
-    "htv4.hr": "HTV4",
-    "nova.hr": "Nova TV",
-    "rtl.hr": "RTL",
-    "rtl2.hr": "RTL2",
-    "doma-tv.movie": "Doma TV",
-    "plava-televizija.hr": "Plava TV",
-    "vinkovacka-tv.hr": "Vinkovačka TV",
-    "tv-zapad.hr": "TV Zapad",
-    "slo1.si": "SLO1",
-    "slo2.si": "SLO2",
-    "slo3.si": "SLO3",
-    "nova-m.cg": "Nova M",
-    "al-jazeera-balkans.info": "Al Jazeera Balkans",
-    "rtrs.ba": "RTRS",
-    "bht1.ba": "BHT1",
-    "ftv.ba": "FTV",
-    "obn.ba": "OBN",
-    "hayat-tv.ba": "Hayat",
-    "nova-bh.ba": "Nova BH",
-    "cartoon-network.toons": "Cartoon Network",
-    "disney-channel.toons": "Disney Channel",
-    "kika.toons": "Kika",
-    "mtv00s.music": "MTV 00",
-    "cmc.music": "CMC Music",
-    "hbo.movie": "HBO",
-    "scifi.movie": "SciFi",
-    "cinestar-tv.movie": "Cinestar",
-    "discovery-europe.doc": "Discovery",
-    "eurosport.sport": "Eurosport",
-    "sportklub-hr.sport": "Sport Klub HR",
-    "tv-arena-sport-1-hr.sport": "Arena Sport 1 HR",
-    "arena-sport-1-ba.sport": "Arena Sport 1 BH",
-    "tv-arena-sport-1.sport": "Arena Sport 1",
-    "tv-arena-sport-2.sport": "Arena Sport 2",
-    "tv-arena-sport-3.sport": "Arena Sport 3",
-    "cnn.info": "CNN",
-    "euronews.info": "Euronews",
-    "skynews.info": "Sky News",
-    "bbc1.uk": "BBC1",
-    "cnbc.info": "CNBC",
-    "bloomberg.info": "Bloomberg",
-    "rai-1.it": "RAI1",
-    "rtl-de.de": "RTL DE",
-    "pro-7.de": "PRO7",
-    "kabel-1.de": "Kabel1",
-    "sat-1.de": "Sat1",
-    "zdf.de": "ZDF"
-}
+EPG_DIR = DEFAULT_EPG_DIR  # EPG storage directory, follows the storagePath setting (see setStorage)
+FRESHNESS_FILE = freshnessFile(EPG_DIR)
+EPG_CACHE_DIR = cacheDir(EPG_DIR)
+STATS_FILE = statsFile(EPG_DIR)
+REFRESH_DEADLINE = 180  # Seconds all downloads of a refresh may take, the rest is cancelled and retried next time
+EPG_POLL_INTERVAL = 100  # ms between checks for EPG data coming from the worker thread
+RETENTION_INTERVAL = 10 * 60 * 1000  # ms between evictions of programmes that left the retention window
+NOW_NEXT_MAX_WAIT = 3600  # Seconds the Now/Next timer sleeps at most, in case the clock was set meanwhile
+NAVIGATION_DELAY = 150  # ms the channel cursor has to rest before EPG and picon follow, longer than key repeat
+PICON_PREFETCH_DELAY = 150  # ms the cursor has to rest before neighbouring picons are preloaded
+PICON_PREFETCH_DISTANCE = 2  # Channels above and below the cursor whose picons are preloaded
+BACKGROUND_CANCEL_WAIT = 5  # Seconds a refresh waits for a cancelled background fetch to let go of its files
+
+
+def setStorage(element=None):
+    """Point the feed, cache and metadata paths at the configured storage location.
+
+    Called again before every refresh: while the mount of the location is missing, RAM is used instead of
+    writing below the empty mount point.
+    """
+    global EPG_DIR, FRESHNESS_FILE, EPG_CACHE_DIR, STATS_FILE
+    path = config.plugins.CiefpTvProgram.storagePath.value
+    mount = storageMount(path)
+    if mount and not os.path.ismount(mount):
+        logger.warning("EPG storage %s is not mounted, using %s", mount, DEFAULT_EPG_DIR)
+        path = DEFAULT_EPG_DIR
+    if path == EPG_DIR and element is None:
+        return
+    EPG_DIR = path
+    FRESHNESS_FILE = freshnessFile(EPG_DIR)
+    EPG_CACHE_DIR = cacheDir(EPG_DIR)
+    STATS_FILE = statsFile(EPG_DIR)
+    logger.debug("EPG storage: %s", EPG_DIR)
+
+
+config.plugins.CiefpTvProgram.storagePath.addNotifier(setStorage)
+
+CHANNELS = loadChannels()
+
+
+class EPGService:
+    """Parsed EPG of all channels, shared by every screen for the lifetime of the Enigma2 process.
+
+    Only the first open after a boot parses feeds, later opens find the data in memory and just revalidate
+    stale channels. Schedules are kept within the memoryBudget setting: the least recently viewed channels are
+    evicted and reloaded from the binary cache when they are viewed again. Evicted channels keep their search
+    postings, which are not counted against the budget, and a few hours of Now/Next, so both overviews stay
+    complete. Screens follow changes through
+    listeners, called on the main loop with (kind, channel_name, detail).
+    """
+
+    def __init__(self):
+        self.epgData = OrderedDict()  # channel_name: ChannelSchedule, least recently used first
+        self.sizes = {}  # channel_name: approximate bytes of the schedule, freed by eviction
+        self.used = 0
+        self.postingSizes = {}  # channel_name: approximate bytes of the search postings, kept when evicted
+        self.resident = 0
+        self.evictions = 0
+        self.reloads = 0
+        self.loadedFrom = {}  # chan_id: signature of the feed its schedule came from
+        self.nowNext = NowNextIndex()
+        self.searchIndex = SearchIndex(self.loadEvicted)
+        self.stats = PipelineStats()
+        self.listeners = []
+        self.epgLoading = False
+        self.epgQueue = queue.Queue()
+        self.epgCancel = threading.Event()
+        self.epgDownloader = None
+        self.parsePool = None
+        self.epgCache = None
+        self.freshness = None
+        self.epgTimer = eTimer()
+        self.epgTimer.callback.append(self.drainEPGQueue)
+        self.retentionTimer = eTimer()
+        self.retentionTimer.callback.append(self.applyRetention)
+        self.retentionTimer.start(RETENTION_INTERVAL, False)
+
+    def notify(self, kind, channel_name=None, detail=None):
+        for listener in list(self.listeners):
+            try:
+                listener(kind, channel_name, detail)
+            except Exception as e:
+                logger.error("EPG listener error on %s: %s", kind, e)
+
+    def get(self, channel_name):
+        """Schedule of a channel, reloaded from the binary cache if it was evicted, None if there is none."""
+        schedule = self.epgData.get(channel_name)
+        if schedule is not None:
+            self.epgData.move_to_end(channel_name)
+            return schedule
+        channel = CHANNELS.getByName(channel_name)
+        if channel is None or channel.id not in self.loadedFrom or self.epgCache is None:
+            return None
+        schedule = self.loadEvicted(channel_name)
+        if schedule is None:
+            return None
+        self.reloads += 1
+        logger.debug("Reloaded evicted channel %s from cache", channel_name)
+        self.setSchedule(channel_name, schedule)  # Its search postings stayed resident
+        return schedule
+
+    def loadEvicted(self, channel_name):
+        """Schedule of an evicted channel from the binary cache, without taking it back into memory."""
+        channel = CHANNELS.getByName(channel_name)
+        if channel is None or channel.id not in self.loadedFrom or self.epgCache is None:
+            return None
+        schedule = self.epgCache.load(channel.id)
+        if schedule is not None:
+            schedule.retain(*self.getRetentionWindow())
+        return schedule
+
+    def setSchedule(self, channel_name, schedule, postings=None):
+        """Take a schedule into memory, without postings the resident ones of the channel are kept."""
+        self.used -= self.sizes.get(channel_name, 0)
+        self.epgData[channel_name] = schedule
+        self.epgData.move_to_end(channel_name)
+        self.sizes[channel_name] = schedule.memorySize()
+        self.used += self.sizes[channel_name]
+        self.nowNext.update(channel_name, schedule, int(time.time()))
+        if postings is None:
+            self.searchIndex.attach(channel_name, schedule)
+        else:
+            self.resident -= self.postingSizes.get(channel_name, 0)
+            self.postingSizes[channel_name] = postingsSize(postings)
+            self.resident += self.postingSizes[channel_name]
+            self.searchIndex.update(channel_name, schedule, postings)
+        self.enforceBudget(channel_name)
+
+    def enforceBudget(self, keep=None):
+        """Evict least recently used channels until their schedules fit the memory budget.
+
+        Search postings cannot be evicted, counting them would only evict every other schedule once they alone
+        exceed a small budget, so they are reported in counters() but left out.
+        """
+        budget = int(config.plugins.CiefpTvProgram.memoryBudget.value) * 1024 * 1024
+        now = int(time.time())
+        while self.used > budget and len(self.epgData) > 1:
+            channel_name = next(iter(self.epgData))
+            if channel_name == keep:
+                self.epgData.move_to_end(channel_name)
+                channel_name = next(iter(self.epgData))
+            del self.epgData[channel_name]
+            self.used -= self.sizes.pop(channel_name)
+            self.nowNext.release(channel_name, now)
+            self.searchIndex.release(channel_name)
+            self.evictions += 1
+            logger.debug("Evicted %s, EPG memory %s KB", channel_name, self.used // 1024)
+            self.notify("evicted", channel_name)
+
+    def counters(self):
+        return {
+            "channels": len(self.epgData),
+            "used_kb": self.used // 1024,
+            "resident_kb": self.resident // 1024,
+            "budget_kb": int(config.plugins.CiefpTvProgram.memoryBudget.value) * 1024,
+            "evictions": self.evictions,
+            "reloads": self.reloads,
+        }
+
+    def start(self, channel_ids=None, force=False):
+        """Download and parse EPG off the UI thread, channels show up as they become ready.
+
+        channel_ids limits the refresh to some channels, force revalidates them even when still fresh.
+        Returns False if a refresh is already running.
+        """
+        if self.epgLoading:
+            return False
+        setStorage()
+        self.epgLoading = True
+        self.epgCancel.clear()
+        worker = threading.Thread(target=self.downloadAndParseEPG, args=(channel_ids, force), name="CiefpTvProgramEPG")
+        worker.daemon = True
+        worker.start()
+        self.epgTimer.start(EPG_POLL_INTERVAL, False)
+        return True
+
+    def stop(self):
+        self.epgTimer.stop()
+        self.retentionTimer.stop()
+        self.epgCancel.set()
+        if self.epgDownloader:
+            self.epgDownloader.cancel()
+        logger.debug("EPG service stopped")
+
+    def postEPG(self, epg, changes=None, postings=None):
+        """Hand parsed channels over to the main loop (called from the worker thread).
+
+        changes maps channel names to the number of programme slots that differ from the previous data.
+        Search postings are built here unless postings already has them.
+        """
+        for channel_name, schedule in epg.items():
+            if len(schedule):
+                channel_postings = postings.get(channel_name) if postings else None
+                if channel_postings is None:
+                    with self.stats.span("index", CHANNELS.getByName(channel_name).id):
+                        channel_postings = buildPostings(schedule)
+                self.epgQueue.put(("channel", channel_name, schedule, changes.get(channel_name, 0) if changes else 0,
+                                   channel_postings))
+
+    def drainEPGQueue(self):
+        """Merge EPG data posted by the worker into epgData (runs on the main loop)."""
+        while True:
+            try:
+                message = self.epgQueue.get_nowait()
+            except queue.Empty:
+                break
+            kind = message[0]
+            if kind == "channel":
+                channel_name, schedule, changes, postings = message[1:]
+                known = channel_name in self.epgData
+                # Always swap in the new schedule, its descriptions point at the current cache file
+                self.setSchedule(channel_name, schedule, postings)
+                logger.debug("EPG ready for %s: %s entries, %s changed", channel_name, len(schedule), changes)
+                self.notify("channel", channel_name, bool(changes or not known))
+            elif kind == "error":
+                logger.error(message[1])
+                self.notify("error", None, message[1])
+            elif kind == "done":
+                self.epgLoading = False
+                self.epgTimer.stop()
+                self.stats.finish()
+                self.stats.setCounters("epg memory", self.counters())
+                self.stats.write(STATS_FILE)
+                logger.debug("EPG loading finished for %s channels", len(self.epgData))
+                self.notify("done")
+
+    def downloadAndParseEPG(self, channel_ids=None, force=False):
+        """Runs in the worker thread, results are passed to the main loop through epgQueue.
+
+        channel_ids limits the refresh to some channels, force revalidates them even when still fresh.
+        """
+        self.stats.begin(config.plugins.CiefpTvProgram.traceMemory.value)
+        try:
+            self.epgCache = EPGCache(EPG_CACHE_DIR)
+            if channel_ids is None:
+                channel_ids = CHANNELS.ids
+
+            # Check if EPGImport file exists
+            epgimport_file = findEPGImportFile()
+            if epgimport_file:
+                logger.debug("Using EPGImport file: %s", epgimport_file)
+                self.loadEPG(epgimport_file, channel_ids)
+                return
+            removed = removeLegacyFiles()
+            if removed:
+                logger.debug("Removed %s obsolete EPG files of older versions", removed)
+            if backgroundRefresh is not None:
+                backgroundRefresh.cancel()  # Neither may download a feed the other is writing
+            self.freshness = FreshnessStore(FRESHNESS_FILE)
+
+            # Fresh channels are served from cache, stale or previously failed ones are (re)validated. Feeds
+            # flow into the parse pool as their downloads finish, so parsing overlaps the network
+            jobs = []
+            for chan_id in channel_ids:
+                if self.epgCancel.is_set():
+                    return
+                epg_file = feedFile(EPG_DIR, chan_id)
+                cached = os.path.exists(epg_file)
+                if cached and not force and not self.freshness.isStale(chan_id):
+                    self.loadEPG(epg_file, {chan_id})
+                    continue
+                url = CHANNELS.get(chan_id).url
+                if not url:
+                    logger.debug("No EPG URL for channel ID: %s", chan_id)
+                    continue
+                headers = {}
+                if cached:
+                    # Serve the last good feed right away, whatever happens to its revalidation
+                    self.loadEPG(epg_file, {chan_id})
+                    headers = self.freshness.conditionalHeaders(chan_id)
+                jobs.append((chan_id, url, epg_file, headers))
+
+            # Download stale channels, several at once over pooled connections
+            if jobs:
+                self.getParsePool()  # Parser processes are forked before any download thread runs
+                self.epgDownloader = EPGDownloader()
+                results, wall_time = self.epgDownloader.downloadAll(jobs, self.onEPGDownloaded, REFRESH_DEADLINE)
+                logger.debug("EPG download of %s channels finished in %.2fs", len(jobs), wall_time)
+                self.stats.setCounters("network", self.epgDownloader.stats())
+            self.freshness.save()
+        except Exception as e:
+            logger.error("General EPG processing error: %s", e)
+            self.epgQueue.put(("error", f"Greška pri preuzimanju EPG-a: {str(e)}"))
+        finally:
+            self.finishParsing()
+            self.epgQueue.put(("done",))
+
+    def finishParsing(self):
+        """Post the feeds still being parsed and shut the parse pool down (worker thread)."""
+        pool = self.parsePool
+        if pool is None:
+            return
+        try:
+            self.collectParsed(block=True)
+        except Exception as e:
+            logger.error("Error collecting parsed EPG: %s", e)
+        finally:
+            pool.shutdown(cancel=self.epgCancel.is_set())
+            self.parsePool = None
+
+    def onEPGDownloaded(self, result):
+        """Parse one channel as soon as its download completes (worker thread)."""
+        if self.epgCancel.is_set():
+            return
+        chan_id = result.chan_id
+        self.stats.add("download", chan_id, result.elapsed)
+        epg_file = result.path  # The feed is kept as downloaded and parsed straight from the compressed file
+        if result.status == 304:
+            logger.debug("EPG for %s not modified, using cached file", chan_id)
+        elif result.ok:
+            logger.debug("EPG saved to: %s", epg_file)
+        self.freshness.record(result)
+        # Load the downloaded file, or the previously cached one if the download failed
+        if os.path.exists(epg_file):
+            self.loadEPG(epg_file, {chan_id})
+        self.collectParsed()
+
+    def loadEPG(self, epg_file, channel_ids):
+        """Post EPG of channel_ids from the binary cache, or queue epg_file in the parse pool when the cache is
+        outdated. The parse pool merges a feed into the previously cached programmes of each channel, so only
+        slots that actually changed count as changes and invalidate views (see collectParsed).
+        """
+        signature = sourceSignature(epg_file)
+        if all(self.loadedFrom.get(chan_id) == signature for chan_id in channel_ids):
+            logger.debug("EPG of %s already loaded", epg_file)
+            return
+        epg = self.loadCachedEPG(epg_file, channel_ids)
+        if epg is None:
+            logger.debug("Parsing EPG file: %s", epg_file)
+            self.getParsePool().submit((epg_file, channel_ids, signature), epg_file, channel_ids,
+                                       self.epgCache.directory, self.getCacheSince(), self.getRetentionWindow())
+            return
+        logger.debug("Loaded %s channels from EPG cache for %s", len(channel_ids), epg_file)
+        self.publishEPG(epg, channel_ids, signature)
+
+    def getParsePool(self):
+        if self.parsePool is None:
+            self.parsePool = ParsePool(None if config.plugins.CiefpTvProgram.parallelParse.value else 0)
+        return self.parsePool
+
+    def collectParsed(self, block=False):
+        """Post the channels of feeds the parse pool finished, with block wait for all of them (worker thread)."""
+        if self.parsePool is None:
+            return
+        for (epg_file, channel_ids, signature), result in self.parsePool.completed(block):
+            if self.epgCancel.is_set():
+                return
+            if isinstance(result, Exception):
+                logger.error("EPG parsing error: %s", result)
+                self.epgQueue.put(("error", f"Greška pri parsiranju EPG-a: {str(result)}"))
+                continue
+            self.stats.absorb(result.stats)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Unmatched EPG channel IDs: %s", sorted(result.unmatched))
+            # Continue with the stored copies, their descriptions stay on disk instead of in memory
+            epg = {}
+            changes = {}
+            postings = {}
+            for chan_id in channel_ids:
+                with self.stats.span("cache_load", chan_id):
+                    schedule = self.epgCache.load(chan_id)
+                if schedule is not None:
+                    channel_name = CHANNELS.get(chan_id).name
+                    epg[channel_name] = schedule
+                    changes[channel_name] = result.changes.get(chan_id, 0)
+                    postings[channel_name] = result.postings.get(chan_id)
+            logger.debug("Merged %s into cache, changed slots: %s", epg_file, changes)
+            self.publishEPG(epg, channel_ids, signature, changes, postings)
+
+    def publishEPG(self, epg, channel_ids, signature, changes=None, postings=None):
+        since, until = self.getRetentionWindow()
+        for schedule in epg.values():
+            schedule.retain(since, until)
+        self.postEPG(epg, changes, postings)
+        for chan_id in channel_ids:
+            self.loadedFrom[chan_id] = signature
+
+    def loadCachedEPG(self, epg_file, channel_ids):
+        """{channel_name: ChannelSchedule} from the binary cache, None if any channel has to be parsed again."""
+        epg = {}
+        for chan_id in channel_ids:
+            with self.stats.span("cache_load", chan_id):
+                schedule = self.epgCache.load(chan_id, epg_file)
+            if schedule is None:
+                return None
+            epg[CHANNELS.get(chan_id).name] = schedule
+        return epg
+
+    def getCacheSince(self):
+        """Oldest programme end kept in the cache: everything from today on, or more for a wide retention."""
+        return min(localMidnight(datetime.date.today()), self.getRetentionWindow()[0])
+
+    def getRetentionWindow(self):
+        settings = config.plugins.CiefpTvProgram
+        return retentionWindow(int(time.time()), int(settings.retentionHours.value), int(settings.retentionDays.value))
+
+    def applyRetention(self):
+        """Evict programmes that left the retention window as time went by."""
+        since, until = self.getRetentionWindow()
+        dropped = 0
+        for channel_name, schedule in list(self.epgData.items()):
+            removed = schedule.retain(since, until)
+            if removed:
+                dropped += removed
+                self.nowNext.update(channel_name, schedule, int(time.time()))
+                self.notify("retention", channel_name)
+        logger.debug("Retention evicted %s programmes", dropped)
+        # Evicted channels keep only a few hours of Now/Next, renewed from the cache before they run out
+        now = int(time.time())
+        for channel_name in self.nowNext.expiring(now, RELEASE_HORIZON // 2):
+            schedule = self.loadEvicted(channel_name)
+            if schedule is not None:
+                self.nowNext.update(channel_name, schedule, now)
+                self.nowNext.release(channel_name, now)
+
+
+epgService = None
+
+
+def getEPGService():
+    global epgService
+    if epgService is None:
+        epgService = EPGService()
+    return epgService
+
 
 class CiefpTvProgram(Screen):
     skin = """
@@ -234,7 +545,7 @@ class CiefpTvProgram(Screen):
     def __init__(self, session):
         Screen.__init__(self, session)
 
-        self.channelListData = CHANNEL_LIST_DATA
+        self.channelListData = CHANNELS.names
         self["channelList"] = MenuList(self.channelListData, enableWrapAround=True)
         self["epgInfo"] = MenuList([], enableWrapAround=True)
         self["picon"] = Pixmap()
@@ -242,41 +553,62 @@ class CiefpTvProgram(Screen):
         self["backgroundLogo"] = Pixmap()
         self["sideBackground"] = Pixmap()
 
-        self["actions"] = ActionMap(["OkCancelActions", "DirectionActions"],
+        self["actions"] = ActionMap(["OkCancelActions", "DirectionActions", "MenuActions", "ColorActions"],
             {
                 "ok": self.switchView,
                 "cancel": self.exit,
                 "up": self.up,
-                "down": self.down
+                "down": self.down,
+                "menu": self.openSetup,
+                "red": self.openSearch,
+                "green": self.openNowNext,
+                "yellow": self.refreshCurrentChannel,
+                "blue": self.openDiagnostics
             }, -1)
 
         self.currentView = "channels"
-        self.epgData = {}
-        self.epgLines = []
+        self.epgWindow = EPGWindow(message="")
         self.epgScrollPos = 0
         self.focus_on_channels = True
+        self.service = getEPGService()
+        self.stats = self.service.stats
+        self.renderCache = RenderCache()
+        self.piconCache = PiconCache(PICON_PATH, LoadPixmap, PLACEHOLDER_PICON)
+        self.piconPrefetchTimer = eTimer()
+        self.piconPrefetchTimer.callback.append(self.prefetchPicons)
+        self.navigationTimer = eTimer()
+        self.navigationTimer.callback.append(self.updateEPGAndPicon)
+        self.navigationMoves = 0
+        self.navigationUpdates = 0
+        self.service.listeners.append(self.onEPGEvent)
+        self.onClose.append(self.closeScreen)
+        if backgroundRefresh:
+            backgroundRefresh.paused = True  # The screen refreshes on its own while open
 
+        setStorage()  # The storage mount may have come up since the plugins were loaded
         if not os.path.exists(EPG_DIR):
             try:
                 os.makedirs(EPG_DIR)
-                logger.debug(f"Created EPG directory: {EPG_DIR}")
+                logger.debug("Created EPG directory: %s", EPG_DIR)
             except Exception as e:
-                logger.error(f"Error creating EPG directory: {str(e)}")
+                logger.error("Error creating EPG directory: %s", e)
                 self["epgInfo"].setList([f"Error creating EPG directory: {str(e)}"])
 
-        self.downloadAndParseEPG()
+        self.service.start()  # Only stale channels and changed feeds cost anything after the first open
         self.onLayoutFinish.append(self.loadPluginLogo)
         self.onLayoutFinish.append(self.loadBackgroundLogo)
         self.onLayoutFinish.append(self.updateEPGAndPicon)
         self.onLayoutFinish.append(self.loadSideBackground)
 
     def switchView(self):
+        if self.navigationTimer.isActive():
+            self.updateEPGAndPicon()  # Catch up with the cursor first
         self.currentView = "epg" if self.currentView == "channels" else "channels"
         self.focus_on_channels = self.currentView == "channels"
         self.epgScrollPos = 0
         self["channelList"].instance.setSelectionEnable(self.focus_on_channels)
         self["epgInfo"].instance.setSelectionEnable(not self.focus_on_channels)
-        logger.debug(f"Focus switched to {'channels' if self.focus_on_channels else 'EPG'}")
+        logger.debug("Focus switched to %s", 'channels' if self.focus_on_channels else 'EPG')
         if self.currentView == "epg":
             self.prepareEPGContent()
             self.showEPGContent()
@@ -286,144 +618,184 @@ class CiefpTvProgram(Screen):
     def exit(self):
         self.close()
 
+    def openSetup(self):
+        self.session.open(CiefpTvProgramSetup)
+
+    def openNowNext(self):
+        self.session.openWithCallback(self.selectChannel, CiefpTvProgramNowNext, self.service.nowNext,
+                                      self.channelListData)
+
+    def openSearch(self):
+        self.session.openWithCallback(self.searchEntered, VirtualKeyBoard, title="Pretraga EPG-a", text="")
+
+    def searchEntered(self, query=None):
+        if not query:
+            return
+        start = time.perf_counter()
+        results = self.service.searchIndex.search(query, int(time.time()))
+        logger.debug("Search for %r: %s results in %.1fms", query, len(results), (time.perf_counter() - start) * 1000)
+        self.session.openWithCallback(self.selectChannel, CiefpTvProgramSearch, query, results)
+
+    def selectChannel(self, channel_name=None):
+        channel = CHANNELS.getByName(channel_name) if channel_name else None
+        if channel:
+            self["channelList"].moveToIndex(channel.position)
+            self.updateEPGAndPicon()
+
+    def openDiagnostics(self):
+        self.updateStatsCounters()
+        self.session.open(CiefpTvProgramDiagnostics, self.stats)
+
+    def updateStatsCounters(self):
+        self.stats.setCounters("render cache", self.renderCache.stats())
+        self.stats.setCounters("picon cache", self.piconCache.stats())
+        self.stats.setCounters("epg memory", self.service.counters())
+        self.stats.setCounters("navigation", {"moves": self.navigationMoves, "updates": self.navigationUpdates})
+
     def up(self):
         if self.currentView == "channels":
             self["channelList"].up()
-            self.updateEPGAndPicon()
+            self.scheduleEPGUpdate()
             logger.debug("Moved up in channel list")
         elif self.currentView == "epg":
-            self["epgInfo"].up()
+            self.scrollEPG(-1)
             logger.debug("Moved up in EPG list")
 
     def down(self):
         if self.currentView == "channels":
             self["channelList"].down()
-            self.updateEPGAndPicon()
+            self.scheduleEPGUpdate()
             logger.debug("Moved down in channel list")
         elif self.currentView == "epg":
-            self["epgInfo"].down()
+            self.scrollEPG(1)
             logger.debug("Moved down in EPG list")
 
+    def scrollEPG(self, delta):
+        """Move the EPG selection, paging in lines when it nears the edge of the window."""
+        lines = self.epgWindow.lines
+        self.epgScrollPos = self.epgWindow.step(self["epgInfo"].getSelectedIndex(), delta)
+        if self.epgWindow.lines is not lines:
+            self["epgInfo"].setList(self.epgWindow.lines)
+        self["epgInfo"].moveToIndex(self.epgScrollPos)
+
+    def scheduleEPGUpdate(self):
+        """Follow the channel cursor once it rests, so a held key only moves the cursor.
+
+        Restarting the timer drops the update of the channel passed before.
+        """
+        self.navigationMoves += 1
+        self.piconPrefetchTimer.stop()
+        self.navigationTimer.start(NAVIGATION_DELAY, True)
+
     def updateEPGAndPicon(self):
+        self.navigationTimer.stop()
+        self.navigationUpdates += 1
         current = self["channelList"].getCurrent()
         if current:
             channel_name = current
-            self.prepareEPGContent()  # Prepare EPG content with current program index
-            self.showEPGContent()  # Show EPG content and scroll to current program
-            self.loadPicon(channel_name)
-            logger.debug(f"Updated EPG and picon for channel: {channel_name}")
+            channel = CHANNELS.getByName(channel_name)
+            chan_id = channel.id if channel else None
+            with self.stats.span("prepare", chan_id):
+                self.prepareEPGContent()  # Prepare EPG content with current program index
+            with self.stats.span("show", chan_id):
+                self.showEPGContent()  # Show EPG content and scroll to current program
+            with self.stats.span("picon", chan_id):
+                self.loadPicon(channel_name)
+            logger.debug("Updated EPG and picon for channel: %s", channel_name)
 
     def loadPicon(self, channel_name):
-        chan_id = next((cid for cid, cname in CHANNEL_ID_MAPPING.items() if cname == channel_name), None)
-        if not chan_id:
-            logger.debug(f"No channel ID found for {channel_name}")
+        channel = CHANNELS.getByName(channel_name)
+        if not channel:
+            logger.debug("No channel ID found for %s", channel_name)
             return
-        picon_name = f"{chan_id}.png"
-        filename = os.path.join(PICON_PATH, picon_name)
-        logger.debug(f"Attempting to load picon for channel {channel_name}: {filename}")
-        pixmap = None
-        if os.path.exists(filename):
-            try:
-                file_size = os.path.getsize(filename)
-                logger.debug(f"Picon file found: {filename}, size: {file_size} bytes")
-                pixmap = LoadPixmap(filename)
-                if pixmap:
-                    logger.debug(f"Successfully loaded picon: {filename}")
-                else:
-                    logger.warning(f"Failed to load pixmap for picon: {filename}")
-            except Exception as e:
-                logger.error(f"Error loading picon for {channel_name}: {str(e)}")
-        else:
-            logger.warning(f"Picon file not found: {filename}")
-            if os.path.exists(PLACEHOLDER_PICON):
-                try:
-                    pixmap = LoadPixmap(PLACEHOLDER_PICON)
-                    if pixmap:
-                        logger.debug(f"Successfully loaded placeholder picon: {PLACEHOLDER_PICON}")
-                    else:
-                        logger.warning(f"Failed to load pixmap for placeholder picon: {PLACEHOLDER_PICON}")
-                except Exception as e:
-                    logger.error(f"Error loading placeholder picon: {str(e)}")
-            else:
-                logger.warning(f"Placeholder picon not found: {PLACEHOLDER_PICON}")
-            try:
-                dir_contents = os.listdir(PICON_PATH)
-                logger.debug(f"Picon directory contents: {dir_contents}")
-            except Exception as e:
-                logger.error(f"Error listing picon directory {PICON_PATH}: {str(e)}")
-
+        chan_id = channel.id
+        pixmap = self.piconCache.get(chan_id)
         if pixmap and self["picon"].instance:
             try:
                 self["picon"].instance.setPixmap(pixmap)
-                logger.debug(f"Picon set for channel {channel_name}: {filename}")
+                logger.debug("Picon set for channel %s: %s", channel_name, chan_id)
             except Exception as e:
-                logger.error(f"Error setting picon for {channel_name}: {str(e)}")
+                logger.error("Error setting picon for %s: %s", channel_name, e)
         else:
-            logger.debug(f"Picon widget not initialized or pixmap not loaded for {channel_name}")
+            logger.debug("Picon widget not initialized or pixmap not loaded for %s", channel_name)
+        self.piconPrefetchTimer.start(PICON_PREFETCH_DELAY, True)
+
+    def prefetchPicons(self):
+        """Preload picons around the cursor while the UI is idle, so scrolling to them needs no file access."""
+        if not self.channelListData:
+            return
+        index = self["channelList"].getSelectedIndex()
+        neighbours = []
+        for distance in range(1, PICON_PREFETCH_DISTANCE + 1):
+            for neighbour in (index + distance, index - distance):
+                neighbours.append(CHANNELS.at(neighbour).id)
+        self.piconCache.prefetch(neighbours)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Prefetched picons %s: %s", neighbours, self.piconCache.stats())
 
     def loadPluginLogo(self):
         logo_path = os.path.join(PLUGIN_PATH, "plugin_logo.png")
-        logger.debug(f"Attempting to load plugin logo: {logo_path}")
+        logger.debug("Attempting to load plugin logo: %s", logo_path)
         pixmap = None
         if os.path.exists(logo_path):
             try:
                 file_size = os.path.getsize(logo_path)
-                logger.debug(f"Plugin logo file found: {logo_path}, size: {file_size} bytes")
+                logger.debug("Plugin logo file found: %s, size: %s bytes", logo_path, file_size)
                 pixmap = LoadPixmap(logo_path)
                 if pixmap:
-                    logger.debug(f"Successfully loaded plugin logo: {logo_path}")
+                    logger.debug("Successfully loaded plugin logo: %s", logo_path)
                 else:
-                    logger.warning(f"Failed to load pixmap for plugin logo: {logo_path}")
+                    logger.warning("Failed to load pixmap for plugin logo: %s", logo_path)
             except Exception as e:
-                logger.error(f"Error loading plugin logo: {str(e)}")
+                logger.error("Error loading plugin logo: %s", e)
         else:
-            logger.warning(f"Plugin logo file not found: {logo_path}")
+            logger.warning("Plugin logo file not found: %s", logo_path)
             try:
                 dir_contents = os.listdir(PLUGIN_PATH)
-                logger.debug(f"Plugin directory contents: {dir_contents}")
+                logger.debug("Plugin directory contents: %s", dir_contents)
             except Exception as e:
-                logger.error(f"Error listing plugin directory {PLUGIN_PATH}: {str(e)}")
+                logger.error("Error listing plugin directory %s: %s", PLUGIN_PATH, e)
 
         if pixmap and self["pluginLogo"].instance:
             try:
                 self["pluginLogo"].instance.setPixmap(pixmap)
-                logger.debug(f"Plugin logo set: {logo_path}")
+                logger.debug("Plugin logo set: %s", logo_path)
             except Exception as e:
-                logger.error(f"Error setting plugin logo: {str(e)}")
+                logger.error("Error setting plugin logo: %s", e)
         else:
-            logger.debug(f"Plugin logo widget not initialized or pixmap not loaded")
+            logger.debug("Plugin logo widget not initialized or pixmap not loaded")
 
     def loadBackgroundLogo(self):
         logo_path = os.path.join(PLUGIN_PATH, "background_logo.png")
-        logger.debug(f"Attempting to load background logo: {logo_path}")
+        logger.debug("Attempting to load background logo: %s", logo_path)
         pixmap = None
         if os.path.exists(logo_path):
             try:
                 file_size = os.path.getsize(logo_path)
-                logger.debug(f"Background logo file found: {logo_path}, size: {file_size} bytes")
+                logger.debug("Background logo file found: %s, size: %s bytes", logo_path, file_size)
                 pixmap = LoadPixmap(logo_path)
                 if pixmap:
-                    logger.debug(f"Successfully loaded background logo: {logo_path}")
+                    logger.debug("Successfully loaded background logo: %s", logo_path)
                 else:
-                    logger.warning(f"Failed to load pixmap for background logo: {logo_path}")
+                    logger.warning("Failed to load pixmap for background logo: %s", logo_path)
             except Exception as e:
-                logger.error(f"Error loading background logo: {str(e)}")
+                logger.error("Error loading background logo: %s", e)
         else:
-            logger.warning(f"Background logo file not found: {logo_path}")
+            logger.warning("Background logo file not found: %s", logo_path)
             try:
                 dir_contents = os.listdir(PLUGIN_PATH)
-                logger.debug(f"Plugin directory contents: {dir_contents}")
+                logger.debug("Plugin directory contents: %s", dir_contents)
             except Exception as e:
-                logger.error(f"Error listing plugin directory {PLUGIN_PATH}: {str(e)}")
+                logger.error("Error listing plugin directory %s: %s", PLUGIN_PATH, e)
 
         if pixmap and self["backgroundLogo"].instance:
             try:
                 self["backgroundLogo"].instance.setPixmap(pixmap)
-                logger.debug(f"Background logo set: {logo_path}")
+                logger.debug("Background logo set: %s", logo_path)
             except Exception as e:
-                logger.error(f"Error setting background logo: {str(e)}")
+                logger.error("Error setting background logo: %s", e)
         else:
-            logger.debug(f"Background logo widget not initialized or pixmap not loaded")
+            logger.debug("Background logo widget not initialized or pixmap not loaded")
 
     def loadSideBackground(self):
         bg_path = os.path.join(PLUGIN_PATH, "side_background.png")
@@ -432,228 +804,380 @@ class CiefpTvProgram(Screen):
             try:
                 pixmap = LoadPixmap(bg_path)
             except Exception as e:
-                logger.error(f"Error loading side background: {str(e)}")
+                logger.error("Error loading side background: %s", e)
         if pixmap and self["sideBackground"].instance:
             try:
                 self["sideBackground"].instance.setPixmap(pixmap)
             except Exception as e:
-                logger.error(f"Error setting side background: {str(e)}")
+                logger.error("Error setting side background: %s", e)
 
-    def checkLastUpdate(self):
-        """Check if the last update was more than 2 days ago."""
-        if not os.path.exists(LAST_UPDATE_FILE):
-            logger.debug(f"No last update file found: {LAST_UPDATE_FILE}")
-            return True  # No update file, force update
-        try:
-            with open(LAST_UPDATE_FILE, 'r') as f:
-                last_update_str = f.read().strip()
-            last_update = datetime.datetime.strptime(last_update_str, '%Y-%m-%d')
-            days_since_update = (datetime.datetime.now() - last_update).days
-            logger.debug(f"Last update was {days_since_update} days ago on {last_update_str}")
-            return days_since_update >= 2  # Update if 2 or more days have passed
-        except Exception as e:
-            logger.error(f"Error reading last update file {LAST_UPDATE_FILE}: {str(e)}")
-            return True  # If error, force update
+    def refreshCurrentChannel(self):
+        """Revalidate the EPG of the selected channel only, the rest of the screen keeps its data."""
+        channel = CHANNELS.getByName(self["channelList"].getCurrent())
+        if channel and self.service.start({channel.id}, force=True):
+            logger.debug("Refreshing EPG of %s", channel.id)
 
-    def updateLastUpdateFile(self):
-        """Update the last_update.txt file with the current date."""
-        try:
-            # Delete old last_update file if it exists
-            if os.path.exists(LAST_UPDATE_FILE):
-                os.remove(LAST_UPDATE_FILE)
-                logger.debug(f"Removed old last update file: {LAST_UPDATE_FILE}")
-            # Create new last_update file with current date
-            current_date = datetime.datetime.now().strftime('%Y-%m-%d')
-            with open(LAST_UPDATE_FILE, 'w') as f:
-                f.write(current_date)
-            logger.debug(f"Created new last update file: {LAST_UPDATE_FILE} with date {current_date}")
-        except Exception as e:
-            logger.error(f"Error updating last update file {LAST_UPDATE_FILE}: {str(e)}")
-
-    def downloadAndParseEPG(self):
-        try:
-            # Check if EPGImport file exists
-            if os.path.exists(EPGIMPORT_FILE):
-                logger.debug(f"Using EPGImport file: {EPGIMPORT_FILE}")
-                self.parseEPG(EPGIMPORT_FILE)
-                return
-
-            # Check if update is needed based on last_update.txt
-            if not self.checkLastUpdate():
-                logger.debug("No update needed based on last_update.txt")
-                # Load cached EPG files
-                channel_ids = {chan_id for chan_id, chan_name in CHANNEL_ID_MAPPING.items() if
-                               chan_name in CHANNEL_LIST_DATA}
-                for chan_id in channel_ids:
-                    epg_file = os.path.join(EPG_DIR, f"{chan_id}.xml")
-                    if os.path.exists(epg_file):
-                        logger.debug(f"Parsing cached EPG file: {epg_file}")
-                        self.parseEPG(epg_file)
-                return
+    def closeScreen(self):
+        if backgroundRefresh:
+            backgroundRefresh.paused = False
+        self.piconPrefetchTimer.stop()
+        self.navigationTimer.stop()
+        if self.onEPGEvent in self.service.listeners:
+            self.service.listeners.remove(self.onEPGEvent)
+        if not self.service.epgLoading:
+            # Keep the UI spans recorded since the refresh finished
+            self.updateStatsCounters()
+            self.service.stats.write(STATS_FILE)
 
-            # Proceed with downloading new EPG data per channel with error handling
-            channel_ids = {chan_id for chan_id, chan_name in CHANNEL_ID_MAPPING.items() if
-                           chan_name in CHANNEL_LIST_DATA}
-            for chan_id in channel_ids:
-                url = EPG_URLS.get(chan_id)
-                if not url:
-                    logger.debug(f"No EPG URL for channel ID: {chan_id}")
-                    continue
-                epg_file = os.path.join(EPG_DIR, f"{chan_id}.xml")
-                temp_file = os.path.join(EPG_DIR, f"{chan_id}.xml.gz")
-                try:
-                    logger.debug(f"Downloading EPG for {chan_id} from {url}")
-                    urllib.request.urlretrieve(url, temp_file)
-                    try:
-                        logger.debug(f"Decompressing EPG for {chan_id}: {temp_file}")
-                        with gzip.open(temp_file, 'rb') as f_in:
-                            with open(epg_file, 'wb') as f_out:
-                                f_out.write(f_in.read())
-                    except (gzip.BadGzipFile, OSError) as gz_err:
-                        # Fallback if not actually gzipped
-                        logger.debug(f"Not a gzipped file for {chan_id}, using as-is: {str(gz_err)}")
-                        os.rename(temp_file, epg_file)
-                    finally:
-                        if os.path.exists(temp_file):
-                            os.remove(temp_file)
-                    logger.debug(f"EPG saved to: {epg_file}")
-                except Exception as e:
-                    logger.error(f"Error downloading or processing for {chan_id}: {str(e)}")
-                    if os.path.exists(temp_file):
-                        os.remove(temp_file)
-                    continue  # Skip to next channel
-
-            # Parse all downloaded or cached EPG files
-            for chan_id in channel_ids:
-                epg_file = os.path.join(EPG_DIR, f"{chan_id}.xml")
-                if os.path.exists(epg_file):
-                    logger.debug(f"Parsing EPG file: {epg_file}")
-                    self.parseEPG(epg_file)
-
-            # Update the last_update.txt file after successful process
-            self.updateLastUpdateFile()
-        except Exception as e:
-            logger.error(f"General EPG processing error: {str(e)}")
-            self["epgInfo"].setList([f"Greška pri preuzimanju EPG-a: {str(e)}"])
-
-    def parseEPG(self, epg_file):
-        try:
-            with open(epg_file, 'rb') as f:
-                content = f.read()
-                if content.startswith(b'\xEF\xBB\xBF'):
-                    content = content[3:]
-                try:
-                    xml_content = content.decode('utf-8')
-                except UnicodeDecodeError:
-                    xml_content = content.decode('iso-8859-1')
-                tree = ET.parse(io.StringIO(xml_content))
-            root = tree.getroot()
-            today = datetime.datetime.now().strftime('%Y%m%d')
-            if not self.epgData:
-                self.epgData = {channel_name: [] for channel_name in CHANNEL_LIST_DATA}
-                logger.debug(f"Initialized epgData with channels: {list(self.epgData.keys())}")
-            unmatched_channels = set()
-            programme_dates = set()
-            channel_ids = set()
-
-            for channel in root.findall('channel'):
-                chan_id = channel.get('id')
-                if chan_id:
-                    channel_ids.add(chan_id.lower())
-
-            for programme in root.findall('programme'):
-                chan_id = programme.get('channel')
-                if chan_id:
-                    chan_id = chan_id.lower()
-                    title = programme.find('title').text if programme.find('title') is not None else "No Title"
-                    desc = programme.find('desc').text if programme.find('desc') is not None else ""
-                    start = programme.get('start')
-                    if start:
-                        programme_dates.add(start[:8])
-                        if start[:8] >= today:
-                            channel_name = CHANNEL_ID_MAPPING.get(chan_id)
-                            if channel_name and channel_name in self.epgData:
-                                self.epgData[channel_name].append((start, title, desc))
-                                logger.debug(f"Added EPG entry for {channel_name}: {title} at {start}")
-                            else:
-                                unmatched_channels.add(chan_id)
-            logger.debug(f"Programme dates found: {sorted(programme_dates)}")
-            logger.debug(f"Channel IDs found in EPG: {sorted(channel_ids)}")
-            logger.debug(f"Unmatched EPG channel IDs: {sorted(unmatched_channels)}")
-            logger.debug(f"EPG parsing completed. epgData: {{k: len(v) for k, v in self.epgData.items()}}")
-        except Exception as e:
-            logger.error(f"EPG parsing error: {str(e)}")
-            self["epgInfo"].setList([f"Greška pri parsiranju EPG-a: {str(e)}"])
+    def onEPGEvent(self, kind, channel_name, detail):
+        """Follow changes of the shared EPG data (main loop)."""
+        current = self["channelList"].getCurrent()
+        if kind in ("channel", "retention", "evicted"):
+            # Windows render lazily from their schedule, so one that was replaced must not be reused
+            self.renderCache.invalidate(channel_name)
+            refresh = channel_name == current and kind != "evicted" and (kind == "retention" or detail)
+            if channel_name == current and kind != "evicted" and self.currentView == "epg":
+                self.reloadEPGWindow()
+        elif kind == "error":
+            self["epgInfo"].setList([detail])
+            refresh = False
+        elif kind == "done":
+            self.renderCache.invalidate(current)  # Replace the loading message
+            refresh = not self.service.get(current) if current else False
+        else:
+            refresh = False
+        if refresh and self.currentView == "channels":
+            self.prepareEPGContent()
+            self.showEPGContent()
 
     def getEPGFromXML(self, channel_name):
-        epglist = self.epgData.get(channel_name, [])
-        if not epglist:
-            logger.debug(f"No EPG data for {channel_name} in XML")
-            return [f"Nema EPG podataka za kanal: {channel_name}"]
-        # Group EPG entries by date
-        epg_by_date = {}
-        for start, title, desc in sorted(epglist, key=lambda x: x[0]):
-            date_str = start[:8]
-            date_formatted = datetime.datetime.strptime(date_str, '%Y%m%d').strftime('%d.%m.%Y')
-            time_str = start[8:12]
-            time_formatted = f"{time_str[:2]}:{time_str[2:]}"
-            entry = f"{date_formatted} {time_formatted} - {title}"
-            if desc:
-                entry += f"\n  {desc}"
-            if date_str not in epg_by_date:
-                epg_by_date[date_str] = []
-            epg_by_date[date_str].append(entry)
-
-        # Combine entries with date headers
-        result = []
-        for date_str in sorted(epg_by_date.keys()):
-            date_formatted = datetime.datetime.strptime(date_str, '%Y%m%d').strftime('%d.%m.%Y')
-            result.append(f"--- {date_formatted} ---")
-            result.extend(epg_by_date[date_str])
-        return result
+        """EPGWindow over the schedule of a channel, or showing why there is none."""
+        schedule = self.service.get(channel_name)
+        if not schedule and self.service.epgLoading:
+            return EPGWindow(message=f"Učitavanje EPG podataka za kanal: {channel_name}...")
+        if not schedule:
+            logger.debug("No EPG data for %s in XML", channel_name)
+            return EPGWindow(message=f"Nema EPG podataka za kanal: {channel_name}")
+        return EPGWindow(schedule)
 
     def prepareEPGContent(self):
         current = self["channelList"].getCurrent()
         if current:
             channel_name = current
-            self.epgLines = self.getEPGFromXML(channel_name)
-            logger.debug(f"Prepared EPG content for {channel_name}: {len(self.epgLines)} lines")
-            # Find the index of the current program
-            now = datetime.datetime.now()
-            now_str = now.strftime('%Y%m%d%H%M%S')
-            current_index = 0
-            for i, line in enumerate(self.epgLines):
-                if not line.startswith("---"):
-                    try:
-                        # Extract date and time from the line
-                        date_time_str = line.split(" - ")[0]
-                        date_str, time_str = date_time_str.split(" ")
-                        date_obj = datetime.datetime.strptime(f"{date_str} {time_str}", '%d.%m.%Y %H:%M')
-                        epg_time_str = date_obj.strftime('%Y%m%d%H%M%S')
-                        if epg_time_str <= now_str:
-                            current_index = i
-                        else:
-                            break
-                    except Exception as e:
-                        logger.debug(f"Error parsing EPG line for current program: {line}, error: {str(e)}")
-            self.epgScrollPos = current_index
-            logger.debug(f"Set EPG scroll position to index {current_index} for current program")
+            now = int(time.time())
+            cached = self.renderCache.get(channel_name, now)
+            if cached:
+                self.epgWindow, current_line = cached
+                self.epgScrollPos = self.epgWindow.moveTo(current_line)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("EPG content for %s served from cache: %s", channel_name, self.renderCache.stats())
+                return
+            self.epgWindow = self.getEPGFromXML(channel_name)
+            # Only the lines around the current programme are rendered, see EPGWindow
+            current_line = 0
+            schedule = self.epgWindow.schedule
+            if schedule:
+                index, valid_from, valid_until = schedule.currentWindow(now)
+                if index >= 0:
+                    current_line = self.epgWindow.lineOf(index)
+                self.renderCache.put(channel_name, self.epgWindow, current_line, valid_from, valid_until)
+            self.epgScrollPos = self.epgWindow.moveTo(current_line)
+            logger.debug("Prepared EPG content for %s: %s of %s lines", channel_name, len(self.epgWindow.lines),
+                         len(self.epgWindow))
+            logger.debug("Set EPG scroll position to index %s for current program", self.epgScrollPos)
+
+    def reloadEPGWindow(self):
+        """Show new data of the channel being browsed in the EPG view, keeping the selected programme."""
+        window = self.epgWindow
+        index = window.indexAt(window.offset + self["epgInfo"].getSelectedIndex())
+        start = window.schedule.starts[index] if index is not None else None
+        self.prepareEPGContent()
+        schedule = self.epgWindow.schedule
+        if start is not None and schedule:
+            index = min(bisect_left(schedule.starts, start), len(schedule) - 1)
+            self.epgScrollPos = self.epgWindow.moveTo(self.epgWindow.lineOf(index))
+        self.showEPGContent()
 
     def showEPGContent(self):
-        self["epgInfo"].setList(self.epgLines)
+        self["epgInfo"].setList(self.epgWindow.lines)
         self["epgInfo"].moveToIndex(self.epgScrollPos)
-        logger.debug(f"Showing EPG content, lines: {len(self.epgLines)}, selected index: {self.epgScrollPos}")
+        logger.debug("Showing EPG content, lines: %s, selected index: %s", len(self.epgWindow.lines), self.epgScrollPos)
+
+class CiefpTvProgramSetup(ConfigListScreen, Screen):
+    skin = """
+        <screen name="CiefpTvProgramSetup" position="center,center" size="900,500" title="..:: CiefpTvProgram podešavanja ::..">
+            <widget name="config" position="10,10" size="880,420" itemHeight="40" font="Regular;28" scrollbarMode="showOnDemand" />
+            <widget name="key_red" position="10,445" size="200,45" font="Regular;26" halign="center" valign="center" backgroundColor="#9f1313" />
+            <widget name="key_green" position="220,445" size="200,45" font="Regular;26" halign="center" valign="center" backgroundColor="#1f771f" />
+        </screen>
+    """
+
+    def __init__(self, session):
+        Screen.__init__(self, session)
+        settings = config.plugins.CiefpTvProgram
+        setup_list = [
+            getConfigListEntry("Nivo logovanja", settings.logLevel),
+            getConfigListEntry("Praćenje memorije (tracemalloc)", settings.traceMemory),
+            getConfigListEntry("Zadržane završene emisije", settings.retentionHours),
+            getConfigListEntry("Broj dana EPG-a", settings.retentionDays),
+            getConfigListEntry("Osvežavanje u pozadini", settings.backgroundRefresh),
+            getConfigListEntry("Tihi period od", settings.quietStart),
+            getConfigListEntry("Tihi period do", settings.quietEnd),
+            getConfigListEntry("Lokacija EPG podataka", settings.storagePath),
+            getConfigListEntry("Memorija za EPG", settings.memoryBudget),
+            getConfigListEntry("Paralelno parsiranje (više jezgara)", settings.parallelParse),
+        ]
+        ConfigListScreen.__init__(self, setup_list, session=session)
+        self["key_red"] = Label("Otkaži")
+        self["key_green"] = Label("Sačuvaj")
+        self["setupActions"] = ActionMap(["SetupActions", "ColorActions"],
+            {
+                "save": self.keySave,
+                "cancel": self.keyCancel,
+                "red": self.keyCancel,
+                "green": self.keySave
+            }, -2)
+
+class CiefpTvProgramNowNext(Screen):
+    skin = """
+        <screen name="CiefpTvProgramNowNext" position="center,center" size="1800,800" title="..:: CiefpTvProgram - sada i sledeće ::..">
+            <widget name="list" position="0,0" size="1800,800" scrollbarMode="showAlways" itemHeight="40" font="Regular;28" />
+        </screen>
+    """
+
+    def __init__(self, session, index, channel_names):
+        Screen.__init__(self, session)
+        self.index = index
+        self.channelNames = channel_names
+        self.positions = {channel_name: position for position, channel_name in enumerate(channel_names)}
+        self.index.advance(int(time.time()))
+        self.rows = [self.formatRow(channel_name) for channel_name in channel_names]
+        self["list"] = MenuList(self.rows, enableWrapAround=True)
+        self["actions"] = ActionMap(["OkCancelActions", "DirectionActions"],
+            {
+                "ok": self.select,
+                "cancel": self.close,
+                "up": self["list"].up,
+                "down": self["list"].down
+            }, -1)
+        self.boundaryTimer = eTimer()
+        self.boundaryTimer.callback.append(self.onBoundary)
+        self.boundaryDue = None  # Epoch the boundary timer fires at
+        self.index.listeners.append(self.updateRows)
+        self.onClose.append(self.cleanup)
+        self.scheduleBoundary()
+
+    def formatRow(self, channel_name):
+        running, following = self.index.row(channel_name)
+        row = channel_name
+        if running:
+            row += f"  {time.strftime('%H:%M', time.localtime(running[0]))} {running[1]}"
+        if following:
+            row += f"   |   {time.strftime('%H:%M', time.localtime(following[0]))} {following[1]}"
+        return row
+
+    def updateRows(self, channel_names):
+        """Re-format only the rows whose programmes changed, channels loaded meanwhile may bring an earlier boundary."""
+        for channel_name in channel_names:
+            position = self.positions.get(channel_name)
+            if position is not None:
+                self.rows[position] = self.formatRow(channel_name)
+        self["list"].setList(self.rows)
+        self.scheduleBoundary()
+
+    def scheduleBoundary(self):
+        """Arm the boundary timer, or bring it forward if the next boundary is earlier than planned."""
+        boundary = self.index.nextBoundary()
+        if boundary is None:
+            return
+        now = time.time()
+        delay = min(max(boundary - now, 1), NOW_NEXT_MAX_WAIT)
+        if self.boundaryTimer.isActive() and self.boundaryDue is not None and self.boundaryDue <= now + delay:
+            return
+        self.boundaryDue = now + delay
+        self.boundaryTimer.start(int(delay * 1000), True)
+
+    def onBoundary(self):
+        self.boundaryDue = None
+        changed = self.index.advance(int(time.time()))
+        logger.debug("Now/Next boundary, %s channels changed programme", len(changed))
+        self.scheduleBoundary()
+
+    def select(self):
+        index = self["list"].getSelectedIndex()
+        self.close(self.channelNames[index] if 0 <= index < len(self.channelNames) else None)
+
+    def cleanup(self):
+        self.boundaryTimer.stop()
+        if self.updateRows in self.index.listeners:
+            self.index.listeners.remove(self.updateRows)
+
+
+class CiefpTvProgramSearch(Screen):
+    skin = """
+        <screen name="CiefpTvProgramSearch" position="center,center" size="1800,800" title="..:: CiefpTvProgram pretraga ::..">
+            <widget name="list" position="0,0" size="1800,800" scrollbarMode="showAlways" itemHeight="40" font="Regular;28" />
+        </screen>
+    """
+
+    def __init__(self, session, query, results):
+        Screen.__init__(self, session)
+        self.setTitle(f"Pretraga: {query} ({len(results)})")
+        self.channelNames = [channel_name for start, stop, channel_name, title in results]
+        if results:
+            rows = [f"{time.strftime('%d.%m. %H:%M', time.localtime(start))}  {channel_name} - {title}"
+                    for start, stop, channel_name, title in results]
+        else:
+            rows = [f"Nema rezultata za: {query}"]
+        self["list"] = MenuList(rows, enableWrapAround=True)
+        self["actions"] = ActionMap(["OkCancelActions"],
+            {
+                "ok": self.select,
+                "cancel": self.close
+            }, -1)
+
+    def select(self):
+        index = self["list"].getSelectedIndex()
+        self.close(self.channelNames[index] if 0 <= index < len(self.channelNames) else None)
+
+
+class CiefpTvProgramDiagnostics(Screen):
+    skin = """
+        <screen name="CiefpTvProgramDiagnostics" position="center,center" size="1400,800" title="..:: CiefpTvProgram dijagnostika ::..">
+            <widget name="stats" position="10,10" size="1380,780" font="Console;24" />
+        </screen>
+    """
+
+    def __init__(self, session, stats):
+        Screen.__init__(self, session)
+        self["stats"] = ScrollLabel("\n".join(stats.summaryLines()))
+        self["actions"] = ActionMap(["OkCancelActions", "DirectionActions"],
+            {
+                "ok": self.close,
+                "cancel": self.close,
+                "up": self["stats"].pageUp,
+                "down": self["stats"].pageDown
+            }, -1)
+
+class BackgroundRefresh:
+    """Revalidates stale channel feeds during the quiet hours, so opening the plugin rarely waits for downloads.
+
+    Runs from session start, one conditional download at a time in a short-lived thread, never while the EPG
+    service refreshes. The freshness file is read again for every fetch, the service may have updated it.
+    """
+
+    def __init__(self):
+        self.scheduler = RefreshScheduler(self.findStale, self.fetch, self.quietHours())
+        self.timer = eTimer()
+        self.timer.callback.append(self.tick)
+        self.worker = None
+        self.downloader = None
+        self.paused = False
+
+    def quietHours(self):
+        settings = config.plugins.CiefpTvProgram
+        return int(settings.quietStart.value), int(settings.quietEnd.value)
+
+    def start(self):
+        self.timer.start(CHECK_INTERVAL * 1000, True)
+
+    def stop(self):
+        self.timer.stop()
+        self.cancel()
+
+    def cancel(self, timeout=BACKGROUND_CANCEL_WAIT):
+        """Abort a running fetch and wait for its thread to finish."""
+        downloader = self.downloader
+        if downloader is not None:
+            downloader.cancel()
+        worker = self.worker
+        if worker is not None and worker.is_alive() and worker is not threading.current_thread():
+            worker.join(timeout)
+
+    def tick(self):
+        delay = CHECK_INTERVAL
+        if config.plugins.CiefpTvProgram.backgroundRefresh.value:
+            self.scheduler.quiet_hours = self.quietHours()
+            try:
+                delay = self.scheduler.tick()
+            except Exception as e:
+                logger.error("Background refresh error: %s", e)
+        self.timer.start(int(delay * 1000), True)
+
+    def findStale(self, now):
+        if findEPGImportFile():
+            return []  # EPGImport keeps that file up to date
+        freshness = FreshnessStore(FRESHNESS_FILE)
+        return [channel.id for channel in CHANNELS if channel.url and freshness.isStale(channel.id, now)]
+
+    def fetch(self, chan_id):
+        if self.paused or (self.worker and self.worker.is_alive()):
+            return False
+        if epgService is not None and epgService.epgLoading:
+            return False
+        setStorage()
+        self.worker = threading.Thread(target=self.download, args=(chan_id,), name="CiefpTvProgramRefresh")
+        self.worker.daemon = True
+        self.worker.start()
+        return True
+
+    def download(self, chan_id):
+        try:
+            if not os.path.exists(EPG_DIR):
+                os.makedirs(EPG_DIR)
+            epg_file = feedFile(EPG_DIR, chan_id)
+            freshness = FreshnessStore(FRESHNESS_FILE)
+            headers = freshness.conditionalHeaders(chan_id) if os.path.exists(epg_file) else {}
+            self.downloader = EPGDownloader(workers=1)
+            try:
+                result = self.downloader.fetch(chan_id, CHANNELS.get(chan_id).url, epg_file, headers)
+            finally:
+                self.downloader.pool.closeAll()
+                self.downloader = None
+            if result.error == "cancelled":
+                logger.debug("Background refresh of %s cancelled", chan_id)
+                return
+            # Read again right before saving, so entries the service recorded meanwhile are kept
+            freshness = FreshnessStore(FRESHNESS_FILE)
+            freshness.record(result)
+            freshness.save()
+            logger.debug("Background refresh of %s: status %s, %s bytes", chan_id, result.status, result.size)
+        except Exception as e:
+            logger.error("Background refresh of %s failed: %s", chan_id, e)
+
+
+backgroundRefresh = None
 
 from Plugins.Plugin import PluginDescriptor
 
 def main(session, **kwargs):
     session.open(CiefpTvProgram)
 
+def sessionstart(reason, session=None, **kwargs):
+    global backgroundRefresh
+    if backgroundRefresh is None:
+        backgroundRefresh = BackgroundRefresh()
+        backgroundRefresh.start()
+
+def autostart(reason, **kwargs):
+    # Only autostart plugins are called with reason 1, when Enigma2 shuts down: stop timers and downloads,
+    # then flush the log
+    if reason == 1:
+        if backgroundRefresh is not None:
+            backgroundRefresh.stop()
+        if epgService is not None:
+            epgService.stop()
+        stopLogging()
+
 def Plugins(**kwargs):
-    return PluginDescriptor(
-        name="CiefpTvProgram",
-        description="Tv Program Prikaz EPG-a v1.3",
-        where=[PluginDescriptor.WHERE_PLUGINMENU, PluginDescriptor.WHERE_EXTENSIONSMENU],
-        icon="icon.png",
-        fnc=main
-    )
\ No newline at end of file
+    return [
+        PluginDescriptor(
+            name="CiefpTvProgram",
+            description="Tv Program Prikaz EPG-a v1.3",
+            where=[PluginDescriptor.WHERE_PLUGINMENU, PluginDescriptor.WHERE_EXTENSIONSMENU],
+            icon="icon.png",
+            fnc=main
+        ),
+        PluginDescriptor(where=PluginDescriptor.WHERE_SESSIONSTART, fnc=sessionstart),
+        PluginDescriptor(where=PluginDescriptor.WHERE_AUTOSTART, fnc=autostart),
+    ]
\ No newline at end of file
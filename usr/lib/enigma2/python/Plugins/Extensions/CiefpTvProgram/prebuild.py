@@ -0,0 +1,254 @@
+"""Build the CiefpTvProgram EPG cache without the Enigma2 GUI, e.g. from cron or a boot script.
+
+Runs the download and ingest pipeline of the plugin, so opening the plugin afterwards only loads the binary
+cache. Defaults follow the plugin settings saved in /etc/enigma2/settings:
+
+    cd /usr/lib/enigma2/python/Plugins/Extensions && python3 -m CiefpTvProgram.prebuild --channels rts1,rts2
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import datetime
+from .downloader import EPGDownloader, DEFAULT_WORKERS
+from .freshness import FreshnessStore
+from .epgcache import EPGCache
+from .schedule import localMidnight, retentionWindow
+from .stats import PipelineStats
+from .ingest import ParsePool
+from .logsetup import LOG_FORMAT, LOG_LEVELS, setLogLevel
+from .storage import DEFAULT_EPG_DIR, loadChannels, readSettings, feedFile, freshnessFile, cacheDir, statsFile, \
+    findEPGImportFile
+
+logger = logging.getLogger(__name__)
+
+EXIT_OK = 0  # Every channel has EPG from a current feed
+EXIT_PARTIAL = 1  # Some channels could not be refreshed or parsed, their last good EPG is kept where there is one
+EXIT_USAGE = 2  # Bad arguments, as argparse exits
+EXIT_FAILED = 3  # No channel has EPG, or the run itself failed
+REFRESH_DEADLINE = 180  # Seconds all downloads may take, as in the plugin
+PAST_HOURS = 2  # Default of the retentionHours setting
+DAYS = 7  # Default of the retentionDays setting
+
+# Outcome per channel: parsed from a new or changed feed, cache already current, refresh failed but an older
+# feed was used, no EPG at all
+PARSED, CACHED, STALE, FAILED = "parsed", "cached", "stale", "failed"
+
+
+class Prebuild:
+    """One headless refresh of channel_ids into epg_dir, laid out as the plugin expects it.
+
+    Fresh channels whose cache is current are left alone, stale ones are revalidated and every feed whose
+    cache is outdated goes through ingestFeed() in the parse pool. force revalidates fresh channels as well.
+    """
+
+    def __init__(self, epg_dir, channels, channel_ids, workers=DEFAULT_WORKERS, parsers=None, force=False,
+                 deadline=REFRESH_DEADLINE, past_hours=PAST_HOURS, days=DAYS):
+        self.epg_dir = epg_dir
+        self.channels = channels
+        self.channel_ids = list(channel_ids)
+        self.workers = workers
+        self.parsers = parsers
+        self.force = force
+        self.deadline = deadline
+        self.window = retentionWindow(int(time.time()), past_hours, days)
+        self.cache_since = min(localMidnight(datetime.date.today()), self.window[0])
+        self.stats = PipelineStats()
+        self.cache = None
+        self.freshness = None
+        self.parsePool = None
+        self.states = {}  # chan_id: PARSED/CACHED/FAILED from ingest
+        self.errors = {}  # chan_id: why its feed could not be refreshed
+
+    def run(self):
+        """Refresh all channels, return {chan_id: (outcome, detail)}."""
+        self.stats.begin()
+        try:
+            self.cache = EPGCache(cacheDir(self.epg_dir))
+            epgimport_file = findEPGImportFile()
+            if epgimport_file:
+                logger.debug("Using EPGImport file: %s", epgimport_file)
+                self.ingest(epgimport_file, self.channel_ids)
+            else:
+                self.refresh()
+            self.collect(block=True)
+        finally:
+            if self.parsePool is not None:
+                self.parsePool.shutdown()
+                self.parsePool = None
+            self.stats.finish()
+        outcomes = self.outcomes()
+        counts = {}
+        for outcome, detail in outcomes.values():
+            counts[outcome] = counts.get(outcome, 0) + 1
+        self.stats.setCounters("prebuild", counts)
+        self.stats.write(statsFile(self.epg_dir))
+        return outcomes
+
+    def refresh(self):
+        self.freshness = FreshnessStore(freshnessFile(self.epg_dir))
+        jobs = []
+        for chan_id in self.channel_ids:
+            epg_file = feedFile(self.epg_dir, chan_id)
+            cached = os.path.exists(epg_file)
+            if cached and not self.force and not self.freshness.isStale(chan_id):
+                self.ingest(epg_file, [chan_id])
+                continue
+            url = self.channels.get(chan_id).url
+            if not url:
+                self.errors[chan_id] = "no EPG URL"
+                if cached:
+                    self.ingest(epg_file, [chan_id])
+                continue
+            headers = self.freshness.conditionalHeaders(chan_id) if cached else {}
+            jobs.append((chan_id, url, epg_file, headers))
+        if jobs:
+            self.getParsePool()  # Parser processes are forked before any download thread runs
+            downloader = EPGDownloader(self.workers)
+            results, wall_time = downloader.downloadAll(jobs, self.onDownloaded, self.deadline)
+            logger.debug("EPG download of %s channels finished in %.2fs", len(jobs), wall_time)
+            self.stats.setCounters("network", downloader.stats())
+        self.freshness.save()
+
+    def onDownloaded(self, result):
+        chan_id = result.chan_id
+        self.stats.add("download", chan_id, result.elapsed)
+        self.freshness.record(result)
+        if not result.ok:
+            self.errors[chan_id] = result.error
+        # The downloaded feed, or the previous one if the download failed
+        if os.path.exists(result.path):
+            self.ingest(result.path, [chan_id])
+        self.collect()
+
+    def ingest(self, epg_file, channel_ids):
+        """Queue epg_file in the parse pool unless the cache of all channel_ids was built from it already."""
+        if all(self.cache.isCurrent(chan_id, epg_file) for chan_id in channel_ids):
+            for chan_id in channel_ids:
+                self.states[chan_id] = CACHED
+            return
+        self.getParsePool().submit((epg_file, tuple(channel_ids)), epg_file, channel_ids, self.cache.directory,
+                                   self.cache_since, self.window)
+
+    def getParsePool(self):
+        if self.parsePool is None:
+            self.parsePool = ParsePool(self.parsers)
+        return self.parsePool
+
+    def collect(self, block=False):
+        if self.parsePool is None:
+            return
+        for (epg_file, channel_ids), result in self.parsePool.completed(block):
+            if isinstance(result, Exception):
+                logger.error("EPG parsing error in %s: %s", epg_file, result)
+                for chan_id in channel_ids:
+                    self.states[chan_id] = FAILED
+                    self.errors.setdefault(chan_id, f"parse error: {result}")
+                continue
+            self.stats.absorb(result.stats)
+            for chan_id in channel_ids:
+                self.states[chan_id] = PARSED
+            logger.debug("Merged %s into cache, changed slots: %s", epg_file, result.changes)
+
+    def outcomes(self):
+        outcomes = {}
+        for chan_id in self.channel_ids:
+            state = self.states.get(chan_id, FAILED)
+            error = self.errors.get(chan_id)
+            if state != FAILED and error:
+                state = STALE
+            outcomes[chan_id] = (state, error)
+        return outcomes
+
+
+def exitCode(outcomes):
+    states = [outcome for outcome, detail in outcomes.values()]
+    if not states or all(state == FAILED for state in states):
+        return EXIT_FAILED
+    if any(state in (STALE, FAILED) for state in states):
+        return EXIT_PARTIAL
+    return EXIT_OK
+
+
+def summaryLines(outcomes, stats):
+    counts = ", ".join(f"{state} {sum(1 for outcome, detail in outcomes.values() if outcome == state)}"
+                       for state in (PARSED, CACHED, STALE, FAILED))
+    lines = [f"Channels: {len(outcomes)} ({counts})"]
+    lines.extend(stats.summaryLines())
+    problems = sorted((chan_id, outcome, detail) for chan_id, (outcome, detail) in outcomes.items()
+                      if outcome in (STALE, FAILED))
+    if problems:
+        lines.append("")
+        lines.append("Problems:")
+        for chan_id, outcome, detail in problems:
+            lines.append(f"{chan_id}: {outcome}, {detail or 'no EPG in feed'}")
+    return lines
+
+
+def parseArgs(argv=None, settings=None):
+    settings = readSettings() if settings is None else settings
+    parser = argparse.ArgumentParser(
+        prog="python3 -m CiefpTvProgram.prebuild",
+        description=__doc__.split("\n\n")[0],
+        epilog=f"Exit codes: {EXIT_OK} all channels current, {EXIT_PARTIAL} some channels not refreshed or not "
+               f"parsed, {EXIT_USAGE} bad arguments, {EXIT_FAILED} no EPG at all.")
+    parser.add_argument("--output", default=settings.get("storagePath", DEFAULT_EPG_DIR),
+                        help="EPG storage directory the plugin reads (default: %(default)s)")
+    parser.add_argument("--channels", help="comma separated channel IDs, all channels by default")
+    parser.add_argument("--channel-list", help="channel list JSON instead of the one the plugin uses")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="concurrent downloads (default: %(default)s)")
+    parallel = settings.get("parallelParse", "").lower() != "false"  # Enigma2 saves ConfigYesNo as true/false
+    parser.add_argument("--parsers", type=int, default=None if parallel else 0,
+                        help="parser processes, 0 parses in a thread (default: free cores, at most 3)")
+    parser.add_argument("--force", action="store_true", help="revalidate feeds that are still fresh")
+    parser.add_argument("--deadline", type=float, default=REFRESH_DEADLINE,
+                        help="seconds all downloads may take (default: %(default)s)")
+    parser.add_argument("--past-hours", type=int, default=int(settings.get("retentionHours", PAST_HOURS)),
+                        help="finished programmes kept, in hours (default: %(default)s)")
+    parser.add_argument("--days", type=int, default=int(settings.get("retentionDays", DAYS)),
+                        help="days of EPG indexed, today included (default: %(default)s)")
+    parser.add_argument("--log-level", choices=list(LOG_LEVELS), default="warning")
+    parser.add_argument("--quiet", action="store_true", help="no summary on stdout")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.parsers is not None and args.parsers < 0:
+        parser.error("--parsers must not be negative")
+    if args.deadline <= 0:
+        parser.error("--deadline must be positive")
+    if args.past_hours < 0 or args.days < 1:
+        parser.error("--past-hours must not be negative and --days must be at least 1")
+    return parser, args
+
+
+def main(argv=None):
+    parser, args = parseArgs(argv)
+    logging.basicConfig(format=LOG_FORMAT, level=LOG_LEVELS[args.log_level])
+    setLogLevel(args.log_level)
+    channels = loadChannels((args.channel_list,)) if args.channel_list else loadChannels()
+    if not len(channels):
+        parser.error("no channels in the channel list")
+    if args.channels:
+        channel_ids = [chan_id.strip().lower() for chan_id in args.channels.split(",") if chan_id.strip()]
+        channel_ids = list(dict.fromkeys(channel_ids))  # Without repeats, in the given order
+        unknown = [chan_id for chan_id in channel_ids if channels.get(chan_id) is None]
+        if unknown:
+            parser.error(f"unknown channel IDs: {', '.join(unknown)}")
+    else:
+        channel_ids = [channel.id for channel in channels]
+    prebuild = Prebuild(args.output, channels, channel_ids, args.workers, args.parsers, args.force, args.deadline,
+                        args.past_hours, args.days)
+    try:
+        outcomes = prebuild.run()
+    except Exception as e:
+        logger.error("EPG prebuild failed: %s", e)
+        return EXIT_FAILED
+    if not args.quiet:
+        print("\n".join(summaryLines(outcomes, prebuild.stats)))
+    return exitCode(outcomes)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
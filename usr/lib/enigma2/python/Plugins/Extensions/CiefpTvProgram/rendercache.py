@@ -0,0 +1,56 @@
+from collections import OrderedDict
+
+DEFAULT_CAPACITY = 16  # Channels whose EPG window is kept
+
+
+class RenderCache:
+    """LRU of the EPGWindow and the current-programme line index per channel, so reselecting a channel keeps
+    the lines its window already built.
+
+    An entry is valid while the programme that was current when it was rendered is still running, it is
+    dropped explicitly when the data of its channel changes.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = max(1, capacity)
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, channel_name, now):
+        """Return (window, current_index) for a channel or None."""
+        entry = self.entries.get(channel_name)
+        if entry is not None:
+            window, current_index, valid_from, valid_until = entry
+            if valid_from <= now < valid_until:
+                self.entries.move_to_end(channel_name)
+                self.hits += 1
+                return window, current_index
+            # The current programme rolled over
+            del self.entries[channel_name]
+            self.invalidations += 1
+        self.misses += 1
+        return None
+
+    def put(self, channel_name, window, current_index, valid_from, valid_until):
+        self.entries[channel_name] = (window, current_index, valid_from, valid_until)
+        self.entries.move_to_end(channel_name)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, channel_name):
+        if self.entries.pop(channel_name, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "size": len(self.entries),
+            "capacity": self.capacity,
+        }
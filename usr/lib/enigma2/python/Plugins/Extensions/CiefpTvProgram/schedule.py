@@ -0,0 +1,154 @@
+import sys
+import time
+import array
+import datetime
+from bisect import bisect_left, bisect_right
+
+ONE_DAY = datetime.timedelta(days=1)
+
+
+def localMidnight(day):
+    """Epoch of 00:00 local time on the given date."""
+    return int(time.mktime(day.timetuple()))
+
+
+def retentionWindow(now, past_hours, days):
+    """(since, until) of the programmes kept in memory: past_hours back from now up to the end of the days-th day."""
+    last_day = datetime.date.fromtimestamp(now) + datetime.timedelta(days=days)
+    return now - past_hours * 3600, localMidnight(last_day)
+
+
+class ChannelSchedule:
+    """Programmes of one channel in start-sorted, array-backed columns.
+
+    starts/stops are epoch seconds, a stop of 0 means the feed did not give one. descs is a list, or a
+    LazyDescriptions that reads them from the EPG cache file when accessed.
+    """
+
+    def __init__(self, entries=()):
+        entries = sorted(entries, key=lambda x: x[0])
+        self.starts = array.array('q', [e[0] for e in entries])
+        self.stops = array.array('q', [e[1] for e in entries])
+        self.titles = [e[2] for e in entries]
+        self.descs = [e[3] for e in entries]
+        self.days = None
+
+    @classmethod
+    def fromColumns(cls, starts, stops, titles, descs):
+        schedule = cls()
+        schedule.starts, schedule.stops, schedule.titles, schedule.descs = starts, stops, titles, descs
+        return schedule
+
+    def __len__(self):
+        return len(self.starts)
+
+    def memorySize(self):
+        """Approximate bytes held by the schedule, descriptions left on disk only count their offsets."""
+        size = sys.getsizeof(self.starts) + sys.getsizeof(self.stops) + sys.getsizeof(self.titles)
+        size += sum(sys.getsizeof(title) for title in self.titles)
+        if isinstance(self.descs, list):
+            size += sys.getsizeof(self.descs) + sum(sys.getsizeof(desc) for desc in self.descs)
+        else:
+            size += sys.getsizeof(self.descs.bounds)
+        return size
+
+    def entry(self, index):
+        return self.starts[index], self.stopAt(index), self.titles[index], self.descs[index]
+
+    def entries(self):
+        descs = self.descs[0:len(self.starts)]
+        return [(self.starts[i], self.stopAt(i), self.titles[i], descs[i]) for i in range(len(self.starts))]
+
+    def stopAt(self, index):
+        """End of a programme, falling back to the start of the next one."""
+        if self.stops[index]:
+            return self.stops[index]
+        if index + 1 < len(self.starts):
+            return self.starts[index + 1]
+        return self.starts[index]
+
+    def merge(self, other):
+        """Upsert the programmes of other by start time, return (merged schedule, number of changed slots).
+
+        other is taken as the complete listing of the time span it covers: programmes of self starting inside
+        that span are replaced or dropped, those outside are kept. A kept programme running into the span is cut
+        at its start. Only the covered slots are compared, so the work follows the size of the update.
+        """
+        if not len(other):
+            return self, 0
+        span_start, span_end = other.starts[0], other.stopAt(len(other) - 1)
+        first = bisect_left(self.starts, span_start)
+        # Without stop times span_end is the start of the last programme of other, which is covered as well
+        last = max(bisect_right(self.starts, other.starts[-1]), bisect_left(self.starts, span_end), first)
+        old_slots = {}  # start: (stop, title, desc) of the slots other replaces
+        old_descs = self.descs[first:last]
+        for i in range(first, last):
+            old_slots[self.starts[i]] = (self.stopAt(i), self.titles[i], old_descs[i - first])
+        new_descs = list(other.descs)
+        changes = 0
+        for i in range(len(other)):
+            old_slot = old_slots.pop(other.starts[i], None)
+            if old_slot != (other.stopAt(i), other.titles[i], new_descs[i]):
+                changes += 1  # Added or replaced
+        changes += len(old_slots)  # Dropped
+        if not changes:
+            return self, 0
+        starts = self.starts[:first] + other.starts + self.starts[last:]
+        stops = self.stops[:first] + other.stops + self.stops[last:]
+        if first and stops[first - 1] > span_start:
+            stops[first - 1] = span_start
+        titles = self.titles[:first] + list(other.titles) + self.titles[last:]
+        descs = self.descs[0:first] + new_descs + self.descs[last:len(self.starts)]
+        return ChannelSchedule.fromColumns(starts, stops, titles, descs), changes
+
+    def retain(self, since, until):
+        """Drop programmes that ended before since (the one running at since is kept) or start at/after until.
+
+        Returns the number of programmes dropped.
+        """
+        count = len(self.starts)
+        first = max(self.currentIndex(since), 0)
+        last = max(bisect_left(self.starts, until), first)
+        if first == 0 and last == count:
+            return 0
+        for column in (self.starts, self.stops, self.titles, self.descs):
+            del column[last:]
+            del column[:first]
+        self.days = None
+        return count - len(self.starts)
+
+    def currentIndex(self, now):
+        """Index of the programme running at now, -1 if the schedule starts later."""
+        return bisect_right(self.starts, now) - 1
+
+    def currentWindow(self, now):
+        """(index, valid_from, valid_until) of the programme running at now, index -1 before the first one.
+
+        currentIndex stays the same for any time in [valid_from, valid_until).
+        """
+        index = self.currentIndex(now)
+        valid_from = self.starts[index] if index >= 0 else -sys.maxsize
+        valid_until = self.starts[index + 1] if index + 1 < len(self.starts) else sys.maxsize
+        return index, valid_from, valid_until
+
+    def nextIndices(self, now, count):
+        """Indices of the programme running at now followed by up to count - 1 next ones."""
+        first = max(self.currentIndex(now), 0)
+        return range(first, min(first + count, len(self.starts)))
+
+    def dayBoundaries(self):
+        """[(first index, date), ...] for each local day that has programmes."""
+        if self.days is None:
+            days = []
+            if self.starts:
+                day = datetime.date.fromtimestamp(self.starts[0])
+                last = datetime.date.fromtimestamp(self.starts[-1])
+                index = 0
+                while day <= last:
+                    next_index = bisect_left(self.starts, localMidnight(day + ONE_DAY))
+                    if next_index > index:
+                        days.append((index, day))
+                    index = next_index
+                    day += ONE_DAY
+            self.days = days
+        return self.days
@@ -0,0 +1,96 @@
+import time
+import random
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CHECK_INTERVAL = 15 * 60  # Seconds between looks for stale channels
+STAGGER = 20  # Seconds between two background fetches
+JITTER = 10  # Random seconds added to each fetch slot
+RETRY_DELAY = 5  # Seconds before a fetch that could not start is tried again
+
+
+def inQuietHours(timestamp, start_hour, end_hour):
+    """True if the local hour of timestamp lies in [start_hour, end_hour), the range may wrap past midnight.
+
+    Equal hours mean the whole day.
+    """
+    hour = time.localtime(timestamp).tm_hour
+    if start_hour == end_hour:
+        return True
+    if start_hour < end_hour:
+        return start_hour <= hour < end_hour
+    return hour >= start_hour or hour < end_hour
+
+
+class RefreshScheduler:
+    """Spreads revalidation of stale channels over the quiet hours, one fetch at a time.
+
+    Nothing here sleeps or starts threads: tick() is called from a timer, starts the fetch that is due and
+    returns the seconds until it wants to run again. findStale(now) lists the channel IDs to refresh,
+    fetch(chan_id) starts one refresh and returns False if it cannot right now. clock and rng can be
+    replaced to run the schedule headlessly.
+    """
+
+    def __init__(self, findStale, fetch, quiet_hours=(3, 6), clock=time.time, rng=None, stagger=STAGGER,
+                 jitter=JITTER, check_interval=CHECK_INTERVAL):
+        self.findStale = findStale
+        self.fetch = fetch
+        self.quiet_hours = quiet_hours
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self.stagger = stagger
+        self.jitter = jitter
+        self.check_interval = check_interval
+        self.pending = deque()  # (due, chan_id), in due order
+        self.next_check = 0
+        self.started = 0
+        self.postponed = 0
+
+    def isQuiet(self, now):
+        return inQuietHours(now, *self.quiet_hours)
+
+    def plan(self, now):
+        """Give every stale channel its own slot, stagger seconds apart plus jitter."""
+        self.pending.clear()
+        due = now
+        for chan_id in self.findStale(now):
+            due += self.stagger + self.rng.uniform(0, self.jitter)
+            self.pending.append((due, chan_id))
+        self.next_check = now + self.check_interval
+        if self.pending:
+            logger.debug("Planned %s background fetches until %s", len(self.pending), time.ctime(due))
+
+    def tick(self):
+        """Start the fetch that is due, return the seconds until the next call."""
+        now = self.clock()
+        if not self.isQuiet(now):
+            if self.pending:
+                logger.debug("Quiet hours over, postponing %s background fetches", len(self.pending))
+                self.postponed += len(self.pending)
+                self.pending.clear()
+            self.next_check = 0  # Plan afresh when the next quiet hours start
+            return self.check_interval
+        if not self.pending and now >= self.next_check:
+            self.plan(now)
+        if self.pending and self.pending[0][0] <= now:
+            due, chan_id = self.pending[0]
+            if not self.fetch(chan_id):
+                return RETRY_DELAY
+            self.pending.popleft()
+            self.started += 1
+            # Slots missed while the timer was late (standby) are moved back, so fetches never bunch up
+            if self.pending and self.pending[0][0] < now + self.stagger:
+                shift = now + self.stagger - self.pending[0][0]
+                self.pending = deque((slot + shift, other) for slot, other in self.pending)
+        if self.pending:
+            return max(1, self.pending[0][0] - now)
+        return max(1, self.next_check - now)
+
+    def stats(self):
+        return {
+            "pending": len(self.pending),
+            "started": self.started,
+            "postponed": self.postponed,
+        }
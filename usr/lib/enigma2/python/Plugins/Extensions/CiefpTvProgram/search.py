@@ -0,0 +1,156 @@
+import re
+import sys
+import array
+import heapq
+import unicodedata
+from bisect import bisect_left
+
+MIN_TOKEN_LENGTH = 2  # Shorter words are not indexed
+MAX_RESULTS = 200
+FOLD_CACHE_SIZE = 50000  # Distinct words whose folded form is remembered
+TOKEN_RE = re.compile(r"\w+")
+
+# Serbian, Macedonian and common Russian Cyrillic to Serbian Latin, then Latin diacritics to ASCII
+FOLD_TABLE = str.maketrans({
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "ђ": "dj", "е": "e", "ж": "z", "з": "z", "и": "i",
+    "ј": "j", "к": "k", "л": "l", "љ": "lj", "м": "m", "н": "n", "њ": "nj", "о": "o", "п": "p", "р": "r",
+    "с": "s", "т": "t", "ћ": "c", "у": "u", "ф": "f", "х": "h", "ц": "c", "ч": "c", "џ": "dz", "ш": "s",
+    "ѓ": "gj", "ќ": "kj", "ѕ": "dz", "й": "j", "ы": "y", "э": "e", "ю": "ju", "я": "ja", "ё": "e", "ъ": "",
+    "ь": "", "č": "c", "ć": "c", "š": "s", "ž": "z", "đ": "dj",
+})
+
+foldedWords = {}
+
+
+def foldText(text):
+    """Lower case ASCII form of text for matching: Cyrillic transliterated, diacritics dropped (đ becomes dj)."""
+    text = text.lower().translate(FOLD_TABLE)
+    if not text.isascii():
+        text = "".join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+    return text
+
+
+def tokenize(text):
+    """Folded words of text worth indexing. EPG text repeats the same words a lot, each is folded only once."""
+    tokens = set()
+    for word in set(TOKEN_RE.findall(text.lower())):
+        folded = foldedWords.get(word)
+        if folded is None:
+            if len(foldedWords) >= FOLD_CACHE_SIZE:
+                foldedWords.clear()
+            folded = foldedWords[word] = [token for token in TOKEN_RE.findall(foldText(word))
+                                          if len(token) >= MIN_TOKEN_LENGTH]
+        tokens.update(folded)
+    return tokens
+
+
+def buildPostings(schedule):
+    """{token: array of programme starts} of a channel, from titles and descriptions."""
+    postings = {}
+    descs = schedule.descs[0:len(schedule)]
+    for i in range(len(schedule)):
+        for token in tokenize(f"{schedule.titles[i]} {descs[i]}"):
+            starts = postings.get(token)
+            if starts is None:
+                starts = postings[token] = array.array('I')
+            starts.append(schedule.starts[i])
+    return postings
+
+
+def postingsSize(postings):
+    """Approximate bytes held by the postings of a channel."""
+    return sys.getsizeof(postings) + sum(sys.getsizeof(starts) for starts in postings.values())
+
+
+class SearchIndex:
+    """Inverted index over the programmes of all channels, replaced channel by channel.
+
+    Postings are built off the main loop with buildPostings(). Query words match indexed words by prefix
+    and all of them have to match, results come in start time order. A released channel keeps its postings
+    without its schedule, loader(channel_name) provides the schedule when a search finds something there.
+    """
+
+    def __init__(self, loader=None):
+        self.postings = {}  # token: {channel_name: starts}
+        self.channelTokens = {}
+        self.schedules = {}
+        self.loader = loader
+        self.vocabulary = None  # Sorted tokens for prefix lookups, rebuilt after changes
+
+    def __len__(self):
+        return len(self.postings)
+
+    def update(self, channel_name, schedule, postings):
+        self.remove(channel_name)
+        self.schedules[channel_name] = schedule
+        self.channelTokens[channel_name] = list(postings)
+        for token, starts in postings.items():
+            self.postings.setdefault(token, {})[channel_name] = starts
+        self.vocabulary = None
+
+    def remove(self, channel_name):
+        for token in self.channelTokens.pop(channel_name, ()):
+            channels = self.postings[token]
+            del channels[channel_name]
+            if not channels:
+                del self.postings[token]
+        self.schedules.pop(channel_name, None)
+        self.vocabulary = None
+
+    def release(self, channel_name):
+        """Drop the schedule of a channel but keep its postings."""
+        self.schedules.pop(channel_name, None)
+
+    def attach(self, channel_name, schedule):
+        """Give a released channel its schedule back, its postings are still current."""
+        if channel_name in self.channelTokens:
+            self.schedules[channel_name] = schedule
+
+    def expand(self, word):
+        """Indexed tokens starting with word."""
+        if self.vocabulary is None:
+            self.vocabulary = sorted(self.postings)
+        index = bisect_left(self.vocabulary, word)
+        while index < len(self.vocabulary) and self.vocabulary[index].startswith(word):
+            yield self.vocabulary[index]
+            index += 1
+
+    def search(self, query, since=0, limit=MAX_RESULTS):
+        """[(start, stop, channel_name, title), ...] of programmes matching every word of query.
+
+        Programmes that ended before since are left out.
+        """
+        matches = None  # channel_name: set of starts
+        for word in set(TOKEN_RE.findall(foldText(query))):
+            found = {}
+            for token in self.expand(word):
+                for channel_name, starts in self.postings[token].items():
+                    found.setdefault(channel_name, set()).update(starts)
+            if matches is not None:
+                found = {channel_name: starts & matches[channel_name]
+                         for channel_name, starts in found.items() if channel_name in matches}
+            matches = {channel_name: starts for channel_name, starts in found.items() if starts}
+            if not matches:
+                return []
+        candidates = []
+        schedules = {}
+        for channel_name, starts in (matches or {}).items():
+            schedule = self.schedules.get(channel_name)
+            if schedule is None and self.loader:
+                schedule = self.loader(channel_name)
+            if schedule is None:
+                continue
+            schedules[channel_name] = schedule
+            first = max(schedule.currentIndex(since), 0)
+            if first < len(schedule) and schedule.stopAt(first) <= since:
+                first += 1
+            earliest = schedule.starts[first] if first < len(schedule) else sys.maxsize  # Earlier ones are over
+            candidates.extend((start, channel_name) for start in starts if start >= earliest)
+        results = []
+        for start, channel_name in heapq.nsmallest(limit, candidates):
+            schedule = schedules[channel_name]
+            index = bisect_left(schedule.starts, start)
+            if index == len(schedule) or schedule.starts[index] != start:
+                continue  # Dropped by retention since it was indexed
+            results.append((start, schedule.stopAt(index), channel_name, schedule.titles[index]))
+        return results
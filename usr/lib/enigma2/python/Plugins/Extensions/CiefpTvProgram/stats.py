@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import logging
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+STATS_VERSION = 1
+
+
+class PipelineStats:
+    """Timing spans of the EPG pipeline per stage and channel, with optional tracemalloc peak memory.
+
+    Spans are recorded from the worker and the UI thread alike.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.channels = {}
+        self.counters = {}
+        self.started_at = None
+        self.started = None
+        self.wall_time = None
+        self.memory_peak = None
+
+    def begin(self, trace_memory=None):
+        """Start a refresh, resetting previous spans. trace_memory, if given, replaces the setting from __init__."""
+        if trace_memory is not None:
+            self.trace_memory = trace_memory
+        with self.lock:
+            self.stages = {}
+            self.channels = {}
+            self.counters = {}
+            self.started_at = time.time()
+            self.started = time.perf_counter()
+            self.wall_time = None
+            self.memory_peak = None
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def finish(self):
+        """Close the refresh, recording its wall time and memory peak."""
+        with self.lock:
+            if self.started is not None:
+                self.wall_time = time.perf_counter() - self.started
+        if self.trace_memory and tracemalloc.is_tracing():
+            self.memory_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    @contextmanager
+    def span(self, stage, channel=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, channel, time.perf_counter() - start)
+
+    def add(self, stage, channel, seconds):
+        with self.lock:
+            self._accumulate(self.stages, stage, seconds)
+            if channel:
+                self._accumulate(self.channels.setdefault(channel, {}), stage, seconds)
+
+    def absorb(self, report):
+        """Add the spans of a report recorded elsewhere, e.g. by a parser process."""
+        with self.lock:
+            self._combine(self.stages, report["stages"])
+            for channel, stages in report["channels"].items():
+                self._combine(self.channels.setdefault(channel, {}), stages)
+
+    def _combine(self, table, entries):
+        for stage, other in entries.items():
+            entry = table.get(stage)
+            if entry is None:
+                table[stage] = dict(other)
+            else:
+                entry["count"] += other["count"]
+                entry["total"] += other["total"]
+                entry["max"] = max(entry["max"], other["max"])
+
+    def _accumulate(self, table, stage, seconds):
+        entry = table.get(stage)
+        if entry is None:
+            table[stage] = {"count": 1, "total": seconds, "max": seconds}
+        else:
+            entry["count"] += 1
+            entry["total"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+
+    def setCounters(self, name, values):
+        """Attach a dict of counters (cache hits etc.) to the report."""
+        with self.lock:
+            self.counters[name] = dict(values)
+
+    def report(self):
+        with self.lock:
+            return {
+                "version": STATS_VERSION,
+                "started_at": self.started_at,
+                "wall_time": self.wall_time,
+                "memory_peak": self.memory_peak,
+                "stages": {stage: dict(entry) for stage, entry in self.stages.items()},
+                "channels": {channel: {stage: dict(entry) for stage, entry in stages.items()}
+                             for channel, stages in self.channels.items()},
+                "counters": dict(self.counters),
+            }
+
+    def write(self, path):
+        """Write the report as JSON, atomically."""
+        temp_file = path + ".tmp"
+        try:
+            with open(temp_file, 'w') as f:
+                json.dump(self.report(), f, indent=1, sort_keys=True)
+            os.replace(temp_file, path)
+            logger.debug("Pipeline stats written to %s", path)
+        except Exception as e:
+            logger.error("Error writing pipeline stats %s: %s", path, e)
+
+    def summaryLines(self, slowest=10):
+        """Human readable summary for the diagnostics view."""
+        report = self.report()
+        lines = []
+        if report["wall_time"] is not None:
+            lines.append(f"Refresh: {report['wall_time']:.2f}s")
+        if report["memory_peak"] is not None:
+            lines.append(f"Memory peak: {report['memory_peak'] / 1024:.0f} KB")
+        lines.append("")
+        lines.append("Stage             count     total       max")
+        for stage, entry in sorted(report["stages"].items()):
+            lines.append(f"{stage:<16} {entry['count']:>6} {entry['total'] * 1000:>8.1f}ms {entry['max'] * 1000:>7.1f}ms")
+        for name, values in sorted(report["counters"].items()):
+            lines.append("")
+            lines.append(f"{name}: " + ", ".join(f"{key}={value}" for key, value in sorted(values.items())))
+        totals = sorted(((sum(entry["total"] for entry in stages.values()), channel)
+                         for channel, stages in report["channels"].items()), reverse=True)
+        if totals:
+            lines.append("")
+            lines.append("Slowest channels:")
+            for total, channel in totals[:slowest]:
+                stages = report["channels"][channel]
+                detail = ", ".join(f"{stage} {entry['total'] * 1000:.0f}ms" for stage, entry in sorted(stages.items()))
+                lines.append(f"{channel}: {total * 1000:.0f}ms ({detail})")
+        return lines
@@ -0,0 +1,86 @@
+import os
+import logging
+from .channels import ChannelRegistry
+
+logger = logging.getLogger(__name__)
+
+# Files shared by the plugin and the headless prebuild (see prebuild.py), neither needs Enigma2 to find them
+DEFAULT_EPG_DIR = "/tmp/CiefpTvProgram"  # RAM on most images, emptied on reboot
+EPGIMPORT_FILE = "/etc/epgimport/rytecSRB_Basic.xml"
+EPGIMPORT_FILES = [EPGIMPORT_FILE, EPGIMPORT_FILE + ".gz", EPGIMPORT_FILE + ".xz"]  # Read compressed as-is
+ENIGMA2_SETTINGS = "/etc/enigma2/settings"  # Saved config values, only those that differ from their default
+SETTINGS_PREFIX = "config.plugins.CiefpTvProgram."
+
+# Channel registry: the shipped channels.json, or the user's own list when present
+CHANNELS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "channels.json")
+USER_CHANNELS_FILE = "/etc/enigma2/ciefptvprogram_channels.json"
+
+
+def feedFile(epg_dir, chan_id):
+    """Downloaded XMLTV feed of a channel, kept gzip-compressed."""
+    return os.path.join(epg_dir, f"{chan_id}.xml.gz")
+
+
+def freshnessFile(epg_dir):
+    """Per-channel ETag/Last-Modified/hash metadata."""
+    return os.path.join(epg_dir, "freshness.json")
+
+
+def cacheDir(epg_dir):
+    """Pre-parsed binary EPG per channel."""
+    return os.path.join(epg_dir, "cache")
+
+
+def statsFile(epg_dir):
+    """Timings of the last refresh."""
+    return os.path.join(epg_dir, "stats.json")
+
+
+def findEPGImportFile():
+    """The EPGImport feed if installed, it then replaces the per-channel downloads."""
+    return next((path for path in EPGIMPORT_FILES if os.path.exists(path)), None)
+
+
+def removeLegacyFiles(epg_dir=DEFAULT_EPG_DIR):
+    """Delete what versions before 1.4 left in epg_dir: the global last update date and the decompressed
+    <chan_id>.xml feeds, several MB on the RAM-backed /tmp. Returns the number of files removed.
+    """
+    try:
+        names = os.listdir(epg_dir)
+    except FileNotFoundError:
+        return 0
+    removed = 0
+    for name in names:
+        if name == "last_update.txt" or name.endswith(".xml"):
+            try:
+                os.remove(os.path.join(epg_dir, name))
+                removed += 1
+            except OSError as e:
+                logger.error("Error removing obsolete EPG file %s: %s", name, e)
+    return removed
+
+
+def loadChannels(paths=(USER_CHANNELS_FILE, CHANNELS_FILE)):
+    for path in paths:
+        if os.path.exists(path):
+            try:
+                return ChannelRegistry.load(path)
+            except Exception as e:
+                logger.error("Error loading channel list %s: %s", path, e)
+    return ChannelRegistry()
+
+
+def readSettings(path=ENIGMA2_SETTINGS):
+    """{name: value} of the plugin settings saved by Enigma2, without it running."""
+    settings = {}
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                key, _, value = line.rstrip('\n').partition('=')
+                if key.startswith(SETTINGS_PREFIX):
+                    settings[key[len(SETTINGS_PREFIX):]] = value
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.error("Error reading Enigma2 settings %s: %s", path, e)
+    return settings
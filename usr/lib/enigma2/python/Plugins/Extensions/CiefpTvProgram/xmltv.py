@@ -0,0 +1,151 @@
+import time
+import gzip
+import logging
+import calendar
+from xml.parsers import expat
+
+logger = logging.getLogger(__name__)
+
+GZIP_MAGIC = b'\x1f\x8b'
+XZ_MAGIC = b'\xfd7zXZ\x00'
+READ_SIZE = 64 * 1024
+FALLBACK_ENCODING = 'iso-8859-1'  # Feeds that are not valid UTF-8 are read as Latin-1, as before expat
+ENCODING_ERRORS = {expat.errors.codes[expat.errors.XML_ERROR_INVALID_TOKEN],
+                   expat.errors.codes[expat.errors.XML_ERROR_INCORRECT_ENCODING]}
+
+
+def openFeed(path):
+    """Open an XMLTV feed for streaming, gzip or xz compressed or plain."""
+    with open(path, 'rb') as f:
+        magic = f.read(6)
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.open(path, 'rb')
+    if magic == XZ_MAGIC:
+        try:
+            import lzma
+        except ImportError:
+            raise IOError(f"No xz support in this Python (python3-lzma missing), cannot read {path}")
+        return lzma.open(path, 'rb')
+    return open(path, 'rb')
+
+
+class TimedReader:
+    """File wrapper that measures the time spent in read(), i.e. disk I/O and decompression."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.seconds = 0.0
+
+    def read(self, size=-1):
+        start = time.perf_counter()
+        data = self.stream.read(size)
+        self.seconds += time.perf_counter() - start
+        return data
+
+
+def parseTime(value):
+    """Convert an XMLTV timestamp like '20250630143000 +0200' to epoch seconds, None if malformed.
+
+    Timestamps without an offset are taken as local time.
+    """
+    try:
+        parts = value.split()
+        fields = (int(value[0:4]), int(value[4:6]), int(value[6:8]), int(value[8:10]), int(value[10:12]),
+                  int(value[12:14] or 0))
+        if len(parts) > 1 and parts[1][0] in '+-' and len(parts[1]) == 5:
+            offset = int(parts[1][1:3]) * 3600 + int(parts[1][3:5]) * 60
+            if parts[1][0] == '-':
+                offset = -offset
+            return calendar.timegm(fields + (0, 0, 0)) - offset
+        return int(time.mktime(fields + (0, 0, -1)))
+    except (ValueError, IndexError):
+        return None
+
+
+def iterProgrammes(path, channel_ids=None, skipped=None, stats=None, channel=None):
+    """Yield (chan_id, start, stop, title, desc) for each programme in an XMLTV feed.
+
+    start and stop are epoch seconds, stop is 0 when the feed does not give one. The feed is decompressed and
+    parsed incrementally with expat and no element tree is built, programmes of channels not in channel_ids
+    (lowercase) only cost the tokenizer. Time is proportional to the file size and memory stays constant, which
+    matters for combined feeds of hundreds of MB. The ids of skipped channels are collected into skipped. With
+    stats (a PipelineStats) the read/decompress time is recorded for channel.
+
+    A feed with bytes that are not valid in its encoding is parsed again as iso-8859-1, the programmes already
+    yielded are skipped then.
+    """
+    encoding = None  # The one the feed declares, UTF-8 if none
+    done = 0
+    while True:
+        with openFeed(path) as stream:
+            reader = TimedReader(stream)
+            try:
+                for index, item in enumerate(_iterProgrammes(reader, channel_ids, skipped, encoding)):
+                    if index >= done:
+                        done += 1
+                        yield item
+                return
+            except expat.ExpatError as e:
+                if encoding is not None or e.code not in ENCODING_ERRORS:
+                    raise
+                logger.warning("EPG feed %s is not valid in its encoding (%s), parsing it as %s", path, e,
+                               FALLBACK_ENCODING)
+                encoding = FALLBACK_ENCODING
+            finally:
+                if stats is not None:
+                    stats.add("decompress", channel, reader.seconds)
+
+
+def _iterProgrammes(stream, channel_ids, skipped, encoding=None):
+    ready = []
+    # Programme being collected: [chan_id, start, stop, title, desc], None while skipping
+    current = None
+    field = None
+    text = []
+
+    def startElement(name, attrs):
+        nonlocal current, field
+        if name == 'programme':
+            chan_id = (attrs.get('channel') or "").lower()
+            if chan_id and (channel_ids is None or chan_id in channel_ids):
+                current = [chan_id, attrs.get('start'), attrs.get('stop'), None, None]
+            else:
+                current = None
+                if chan_id and skipped is not None:
+                    skipped.add(chan_id)
+        elif current is not None and field is None:
+            # Only the first title and desc count, feeds may repeat them per language
+            if (name == 'title' and current[3] is None) or (name == 'desc' and current[4] is None):
+                field = name
+                del text[:]
+
+    def endElement(name):
+        nonlocal current, field
+        if name == field:
+            current[3 if name == 'title' else 4] = "".join(text)
+            field = None
+        elif name == 'programme' and current is not None:
+            start = parseTime(current[1] or "")
+            if start is not None:
+                stop = parseTime(current[2] or "") or 0
+                ready.append((current[0], start, stop, current[3] or "No Title", current[4] or ""))
+            current = None
+
+    def characterData(data):
+        if field is not None:
+            text.append(data)
+
+    parser = expat.ParserCreate(encoding)  # Overrides the encoding the feed declares
+    parser.buffer_text = True
+    parser.StartElementHandler = startElement
+    parser.EndElementHandler = endElement
+    parser.CharacterDataHandler = characterData
+    while True:
+        data = stream.read(READ_SIZE)
+        parser.Parse(data, not data)
+        if ready:
+            for item in ready:
+                yield item
+            del ready[:]
+        if not data:
+            break